@@ -0,0 +1,45 @@
+import io
+import time
+from typing import Callable, Dict, List
+
+from util_common.io import json_to_bytes, write_jsonl
+
+N_RECORDS = 100000
+
+
+def _make_records(n: int) -> List[Dict]:
+    return [
+        {"id": i, "name": f"document_{i}.pdf", "size": i * 1024, "tags": ["a", "b"], "ok": True}
+        for i in range(n)
+    ]
+
+
+def _write_json_to_bytes(records: List[Dict]) -> int:
+    stream = io.BytesIO()
+    for record in records:
+        stream.write(json_to_bytes(record))
+        stream.write(b"\n")
+    return stream.tell()
+
+
+def _write_jsonl(records: List[Dict]) -> int:
+    stream = io.BytesIO()
+    write_jsonl(records, stream)
+    return stream.tell()
+
+
+def bench_writer(write_fn: Callable[[List[Dict]], int], n: int = N_RECORDS) -> None:
+    records = _make_records(n)
+    start = time.perf_counter()
+    n_bytes = write_fn(records)
+    elapsed = time.perf_counter() - start
+    print(f"{write_fn.__name__}: {n / elapsed:,.0f} records/sec, {n_bytes:,} bytes")
+
+
+def main() -> None:
+    bench_writer(_write_json_to_bytes)
+    bench_writer(_write_jsonl)
+
+
+if __name__ == "__main__":
+    main()
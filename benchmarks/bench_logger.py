@@ -0,0 +1,39 @@
+import logging
+import time
+from typing import Callable
+
+from util_common.logger import LOG_FORMAT, CustomJsonFormatter, FastJsonFormatter
+
+N_RECORDS = 100000
+
+
+def _make_record(i: int) -> logging.LogRecord:
+    return logging.LogRecord(
+        name="bench",
+        level=logging.INFO,
+        pathname=__file__,
+        lineno=i,
+        msg="record %d",
+        args=(i,),
+        exc_info=None,
+    )
+
+
+def bench_formatter(format_fn: Callable[[logging.LogRecord], str], n: int = N_RECORDS) -> float:
+    records = [_make_record(i) for i in range(n)]
+    start = time.perf_counter()
+    for record in records:
+        format_fn(record)
+    return n / (time.perf_counter() - start)
+
+
+def main() -> None:
+    for name, formatter in [
+        ("CustomJsonFormatter", CustomJsonFormatter(LOG_FORMAT)),
+        ("FastJsonFormatter", FastJsonFormatter()),
+    ]:
+        print(f"{name}: {bench_formatter(formatter.format):,.0f} records/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,26 @@
-from util_common.package import get_package_info
+from functools import lru_cache
+from typing import Any, Dict
 
 APP_NAME = 'util_common'
-__info__ = get_package_info(APP_NAME)
 
-VERSION = __info__.get('version')
-AUTHOR_EMAIL = __info__.get('author_email')
-AUTHOR_NAME = __info__.get('author_name')
+_INFO_KEYS = {
+    'VERSION': 'version',
+    'AUTHOR_EMAIL': 'author_email',
+    'AUTHOR_NAME': 'author_name',
+}
+
+
+@lru_cache(maxsize=None)
+def _get_info() -> Dict:
+    # importlib.metadata is slow to import and to query, resolve on first access.
+    from util_common.package import get_package_info
+
+    return get_package_info(APP_NAME)
+
+
+def __getattr__(name: str) -> Any:
+    if name == '__info__':
+        return _get_info()
+    if name in _INFO_KEYS:
+        return _get_info().get(_INFO_KEYS[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,275 @@
+import os
+import posixpath
+import shutil
+import subprocess
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from util_common.io import (
+    SNIFF_SIZE,
+    STREAM_BUFFER_SIZE,
+    guess_file_extension,
+    guess_path_extension,
+)
+from util_common.path import ARCHIVE_EXTS, IGNORE_NAMES, FileExt, get_extension
+
+SEVEN_ZIP_TOOLS = ["7z", "7za"]
+RAR_TOOLS = ["unrar", "rar"]
+
+
+class ArchiveMember(NamedTuple):
+    name: str
+    size: int
+    is_dir: bool
+
+
+def _get_tool(ext: str) -> str:
+    tools, package = (RAR_TOOLS, "rar") if ext == "rar" else (SEVEN_ZIP_TOOLS, "p7zip-full")
+    for tool in tools:
+        path = shutil.which(tool)
+        if path is not None:
+            return path
+    raise FileNotFoundError(f"{tools[0]} not found, install {package}!")
+
+
+def _parse_seven_zip_listing(listing: str) -> List[ArchiveMember]:
+    """Members from the output of `7z l -slt`, whose entries follow a line of dashes."""
+    _, _, entries = listing.partition("\n----------\n")
+    members = []
+    for block in entries.split("\n\n"):
+        fields = dict(x.split(" = ", 1) for x in block.splitlines() if " = " in x)
+        if "Path" not in fields:
+            continue
+        is_dir = fields.get("Folder") == "+" or fields.get("Attributes", "").startswith("D")
+        members.append(ArchiveMember(fields["Path"], int(fields.get("Size") or 0), is_dir))
+    return members
+
+
+def _parse_rar_listing(listing: str) -> List[ArchiveMember]:
+    """Members from the output of `unrar lt`, one block of `Key: value` lines each."""
+    members = []
+    for block in listing.split("\n\n"):
+        fields = {}
+        for line in block.splitlines():
+            key, sep, value = line.partition(": ")
+            if sep:
+                fields[key.strip()] = value.strip()
+        if "Name" not in fields or "Type" not in fields:
+            continue
+        is_dir = fields["Type"] == "Directory"
+        members.append(ArchiveMember(fields["Name"], int(fields.get("Size") or 0), is_dir))
+    return members
+
+
+class Archive:
+    """
+    Read-only view of a zip, rar or 7z archive at `path`.
+
+    Zip archives are read with `zipfile`, rar ones with the `unrar` or `rar`
+    command and 7z ones with the `7z` command of p7zip, the archive path and
+    member names are passed after `--` so that a leading dash is not a switch.
+    Members with a path part in `ignore_names` are hidden.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        ext: Optional[str] = None,
+        ignore_names: Sequence[str] = IGNORE_NAMES,
+    ) -> None:
+        self.path = str(path)
+        if ext is None:
+            ext = get_extension(path).lower()
+            if ext not in ARCHIVE_EXTS:
+                ext = guess_path_extension(path)
+        if ext not in ARCHIVE_EXTS:
+            raise ValueError(f"{path}: Not an archive!")
+        self.ext = ext
+        self.ignore_names = ignore_names
+        self._members: Optional[List[ArchiveMember]] = None
+        self._local = threading.local()
+        self._zip_files: List[zipfile.ZipFile] = []
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "Archive":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            for zip_file in self._zip_files:
+                zip_file.close()
+            self._zip_files.clear()
+        self._local = threading.local()
+
+    def _zip_file(self) -> zipfile.ZipFile:
+        # One handle per thread, so that members are inflated in parallel.
+        zip_file = getattr(self._local, "zip_file", None)
+        if zip_file is None:
+            zip_file = self._local.zip_file = zipfile.ZipFile(self.path)
+            with self._lock:
+                self._zip_files.append(zip_file)
+        return zip_file
+
+    def _is_ignored(self, name: str) -> bool:
+        return any(x in self.ignore_names for x in name.split("/"))
+
+    def members(self) -> List[ArchiveMember]:
+        if self._members is None:
+            if self.ext == "zip":
+                members = [
+                    ArchiveMember(x.filename, x.file_size, x.is_dir())
+                    for x in self._zip_file().infolist()
+                ]
+            else:
+                if self.ext == "rar":
+                    command = [_get_tool(self.ext), "lt", "-c-", "-p-", "--", self.path]
+                else:
+                    command = [_get_tool(self.ext), "l", "-slt", "--", self.path]
+                result = subprocess.run(
+                    command,
+                    capture_output=True,
+                    check=True,
+                    encoding="utf-8",
+                    errors="surrogateescape",
+                )
+                parse = _parse_rar_listing if self.ext == "rar" else _parse_seven_zip_listing
+                members = parse(result.stdout)
+            self._members = [x for x in members if not self._is_ignored(x.name)]
+        return self._members
+
+    def names(self) -> List[str]:
+        return [x.name for x in self.members() if not x.is_dir]
+
+    @contextmanager
+    def open(self, name: str) -> Iterator[IO[bytes]]:
+        """Stream the content of member `name` without extracting it."""
+        if self.ext == "zip":
+            with self._zip_file().open(name) as f:
+                yield f
+            return
+        if self.ext == "rar":
+            command = [_get_tool(self.ext), "p", "-inul", "-p-", "--", self.path, name]
+        else:
+            command = [_get_tool(self.ext), "x", "-so", "-bd", "-spd", "-y", "--", self.path, name]
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        assert process.stdout is not None and process.stderr is not None
+        finished = False
+        try:
+            yield process.stdout
+            finished = not process.stdout.read(1)
+        finally:
+            if not finished:
+                process.kill()  # the member was not read to the end, stop decompressing it
+            process.stdout.close()
+            process.wait()
+            error = process.stderr.read().decode(errors="replace")
+            process.stderr.close()
+        if finished and process.returncode != 0:
+            raise OSError(f"{self.path}: {error}")
+
+    def read(self, name: str) -> bytes:
+        with self.open(name) as f:
+            return f.read()
+
+    def guess_extension(self, name: str) -> Optional[FileExt]:
+        """`guess_file_extension` of the first bytes of member `name`."""
+        with self.open(name) as f:
+            return guess_file_extension(f.read(SNIFF_SIZE))
+
+    def extract(
+        self,
+        dst_folder: str | Path,
+        names: Optional[Iterable[str]] = None,
+        max_workers: int = 8,
+    ) -> List[str]:
+        """
+        Extract member `names`, all the files by default, under `dst_folder`.
+
+        Zip members are extracted on `max_workers` threads, rar and 7z archives
+        in a single run of their command, which is multi-threaded itself.
+        Returns the extracted paths.
+        """
+        names = self.names() if names is None else list(names)
+        dst_folder = str(dst_folder)
+        if not names:
+            return []
+        if self.ext == "zip":
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                return list(executor.map(lambda x: self._zip_file().extract(x, dst_folder), names))
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix=".txt") as list_file:
+            list_file.write("\n".join(names))
+            list_file.flush()
+            if self.ext == "rar":
+                command = [
+                    _get_tool(self.ext),
+                    "x",
+                    "-o+",
+                    "-p-",
+                    "-y",
+                    "-idq",
+                    "-scfl",
+                    f"-n@{list_file.name}",
+                    "--",
+                    self.path,
+                    os.path.join(dst_folder, ""),
+                ]
+            else:
+                command = [
+                    _get_tool(self.ext),
+                    "x",
+                    "-bd",
+                    "-spd",
+                    "-y",
+                    "-scsUTF-8",
+                    f"-o{dst_folder}",
+                    f"-i@{list_file.name}",
+                    "--",
+                    self.path,
+                ]
+            subprocess.run(command, capture_output=True, check=True)
+        return [os.path.join(dst_folder, *x.split("/")) for x in names]
+
+
+def _is_archive(archive: Archive, name: str) -> bool:
+    ext = get_extension(name).lower()
+    if ext:
+        return ext in ARCHIVE_EXTS
+    return archive.guess_extension(name) in ARCHIVE_EXTS
+
+
+def iter_archive(
+    path: str | Path,
+    recursive: bool = True,
+    ignore_names: Sequence[str] = IGNORE_NAMES,
+    tmp_dir: Optional[str | Path] = None,
+) -> Iterator[Tuple[str, IO[bytes]]]:
+    """
+    Yield the name and a stream of each file in the archive at `path`.
+
+    A stream is only readable until the next item is requested. With `recursive`,
+    members that are archives themselves, by extension or by content when they
+    have none, are copied to `tmp_dir` and their files are yielded instead,
+    named `<member>/<name>`.
+    """
+    with Archive(path, ignore_names=ignore_names) as archive:
+        for name in archive.names():
+            if recursive and _is_archive(archive, name):
+                with tempfile.TemporaryDirectory(dir=tmp_dir) as folder:
+                    nested_path = os.path.join(folder, posixpath.basename(name))
+                    with archive.open(name) as src, open(nested_path, "wb") as dst:
+                        shutil.copyfileobj(src, dst, STREAM_BUFFER_SIZE)
+                    for nested_name, f in iter_archive(
+                        nested_path, recursive, ignore_names, tmp_dir
+                    ):
+                        yield f"{name}/{nested_name}", f
+                continue
+            with archive.open(name) as f:
+                yield name, f
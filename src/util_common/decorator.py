@@ -1,30 +1,249 @@
 import asyncio
+import functools
+import importlib
 import logging
+import math
 import os
+import pickle
+import random
 import re
+import sys
+import threading
 import time
-from typing import Any, Callable, Tuple
+from collections import OrderedDict, deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+)
 
 from util_common._log import log
 
+# Histogram buckets are log-linear: 2 ** _SUB_BUCKET_BITS buckets per power of two,
+# percentiles are accurate to within 1 / 2 ** _SUB_BUCKET_BITS.
+_SUB_BUCKET_BITS = 3
+_SUB_BUCKETS = 1 << _SUB_BUCKET_BITS
+
+
+def _bucket_index(value: int) -> int:
+    n_bits = value.bit_length()
+    if n_bits <= _SUB_BUCKET_BITS:
+        return value
+    shift = n_bits - _SUB_BUCKET_BITS - 1
+    return ((n_bits - _SUB_BUCKET_BITS) << _SUB_BUCKET_BITS) + (
+        (value >> shift) & (_SUB_BUCKETS - 1)
+    )
+
+
+def _bucket_upper_bound(index: int) -> int:
+    if index < _SUB_BUCKETS:
+        return index
+    octave, sub_bucket = divmod(index, _SUB_BUCKETS)
+    shift = octave - 1
+    return ((_SUB_BUCKETS + sub_bucket + 1) << shift) - 1
+
+
+class TimingSummary(NamedTuple):
+    calls: int
+    total_ns: int
+    min_ns: int
+    max_ns: int
+    p50_ns: int
+    p95_ns: int
+    p99_ns: int
+
+    @property
+    def mean_ns(self) -> float:
+        return self.total_ns / self.calls if self.calls else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"calls={self.calls} total={self.total_ns / 1e9:.4f}s "
+            f"mean={self.mean_ns / 1e6:.3f}ms min={self.min_ns / 1e6:.3f}ms "
+            f"p50={self.p50_ns / 1e6:.3f}ms p95={self.p95_ns / 1e6:.3f}ms "
+            f"p99={self.p99_ns / 1e6:.3f}ms max={self.max_ns / 1e6:.3f}ms"
+        )
+
+
+class _TimingStats:
+    __slots__ = ("generation", "count", "total", "min", "max", "buckets")
+
+    def __init__(self, generation: int) -> None:
+        self.generation = generation
+        self.count = 0
+        self.total = 0
+        self.min = math.inf
+        self.max = 0
+        self.buckets: Dict[int, int] = {}
+
+    def record(self, elapsed_ns: int) -> None:
+        self.count += 1
+        self.total += elapsed_ns
+        if elapsed_ns < self.min:
+            self.min = elapsed_ns
+        if elapsed_ns > self.max:
+            self.max = elapsed_ns
+        index = _bucket_index(elapsed_ns)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+
+class TimingRegistry:
+    """
+    Per-name timing histograms.
+
+    Samples are recorded into thread-local stats without locking,
+    `snapshot` merges them and `reset` starts a new generation.
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, List[_TimingStats]] = {}
+        self._generation = 0
+        self._reporter: Optional[threading.Thread] = None
+        self._stop_reporter = threading.Event()
+
+    def record(self, name: str, elapsed_ns: int) -> None:
+        local_stats: Optional[Dict[str, _TimingStats]] = getattr(self._local, "stats", None)
+        if local_stats is None:
+            local_stats = self._local.stats = {}
+        stats = local_stats.get(name)
+        if stats is None or stats.generation != self._generation:
+            stats = local_stats[name] = _TimingStats(self._generation)
+            with self._lock:
+                self._stats.setdefault(name, []).append(stats)
+        stats.record(elapsed_ns)
+
+    def snapshot(self) -> Dict[str, TimingSummary]:
+        with self._lock:
+            generation = self._generation
+            stats_by_name = {name: list(stats) for name, stats in self._stats.items()}
+        summaries = {}
+        for name, stats_list in stats_by_name.items():
+            summary = self._merge([x for x in stats_list if x.generation == generation])
+            if summary is not None:
+                summaries[name] = summary
+        return summaries
+
+    def reset(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._stats.clear()
+
+    def emit(self, print_fn: Callable = log.info, reset: bool = False) -> None:
+        for name, summary in sorted(self.snapshot().items()):
+            print_fn(f"{name}>>> {summary}")
+        if reset is True:
+            self.reset()
+
+    def start_reporting(
+        self,
+        interval: float,
+        print_fn: Callable = log.info,
+        reset: bool = True,
+    ) -> None:
+        """Emit a summary every `interval` seconds on a daemon thread."""
+        self.stop_reporting()
+        self._stop_reporter.clear()
+
+        def _report() -> None:
+            while not self._stop_reporter.wait(interval):
+                self.emit(print_fn, reset=reset)
+
+        self._reporter = threading.Thread(target=_report, daemon=True)
+        self._reporter.start()
+
+    def stop_reporting(self) -> None:
+        if self._reporter is not None:
+            self._stop_reporter.set()
+            self._reporter.join()
+            self._reporter = None
+
+    @staticmethod
+    def _merge(stats_list: List[_TimingStats]) -> Optional[TimingSummary]:
+        count = sum(x.count for x in stats_list)
+        if count == 0:
+            return None
+        min_ns = int(min(x.min for x in stats_list if x.count))
+        max_ns = max(x.max for x in stats_list)
+        buckets: Dict[int, int] = {}
+        for stats in stats_list:
+            for index, n in list(stats.buckets.items()):
+                buckets[index] = buckets.get(index, 0) + n
+
+        def _percentile(q: float) -> int:
+            rank = math.ceil(q * count)
+            cumulative = 0
+            for index in sorted(buckets):
+                cumulative += buckets[index]
+                if cumulative >= rank:
+                    return min(max(_bucket_upper_bound(index), min_ns), max_ns)
+            return max_ns
+
+        return TimingSummary(
+            calls=count,
+            total_ns=sum(x.total for x in stats_list),
+            min_ns=min_ns,
+            max_ns=max_ns,
+            p50_ns=_percentile(0.5),
+            p95_ns=_percentile(0.95),
+            p99_ns=_percentile(0.99),
+        )
+
+
+timing_registry = TimingRegistry()
+
+
+def ticktock(name=None, print_fn=log.info, registry: Optional[TimingRegistry] = None):
+    """
+    Time each call of the decorated function.
+
+    By default the elapsed time is printed with `print_fn` on every call,
+    if `registry` is given samples are aggregated into it instead,
+    e.g. `@ticktock(registry=timing_registry)`.
+    """
 
-def ticktock(name=None, print_fn=log.info):
     def decorator(fn: Callable):
-        def _info(elapsed):
-            return (fn.__name__ if name is None else name) + f">>> Elapsed time: {elapsed:.4f} secs"
+        key = fn.__name__ if name is None else name
+
+        def _done(start_ns: int) -> None:
+            elapsed_ns = time.perf_counter_ns() - start_ns
+            if registry is not None:
+                registry.record(key, elapsed_ns)
+            else:
+                print_fn(key + f">>> Elapsed time: {elapsed_ns / 1e9:.4f} secs")
 
         async def async_wrapper(*args, **kwargs) -> Any:
-            start_time = time.time()
+            start_ns = time.perf_counter_ns()
             result = await fn(*args, **kwargs)
-            elapsed = time.time() - start_time
-            print_fn(_info(elapsed))
+            _done(start_ns)
             return result
 
         def sync_wrapper(*args, **kwargs) -> Any:
-            start_time = time.time()
+            start_ns = time.perf_counter_ns()
             result = fn(*args, **kwargs)
-            elapsed = time.time() - start_time
-            print_fn(_info(elapsed))
+            _done(start_ns)
             return result
 
         if asyncio.iscoroutinefunction(fn):
@@ -35,55 +254,365 @@ def ticktock(name=None, print_fn=log.info):
     return decorator
 
 
-def retry(max_attempts: int, delay: int):
+class RetryBudget:
+    """
+    Failure rate shared by the functions retried with it.
+
+    Retries are refused while more than `max_failure_rate` of the attempts
+    in the last `window` seconds failed, once `min_attempts` were made,
+    so a failing backend is not hit by every worker's retries at once.
+    """
+
+    def __init__(
+        self,
+        max_failure_rate: float = 0.5,
+        window: float = 10.0,
+        min_attempts: int = 10,
+    ) -> None:
+        self.max_failure_rate = max_failure_rate
+        self.window = window
+        self.min_attempts = min_attempts
+        self._buckets: Deque[List[int]] = deque()  # [second, attempts, failures]
+        self._lock = threading.Lock()
+
+    def record(self, failed: bool) -> None:
+        second = int(time.monotonic())
+        with self._lock:
+            self._trim(second)
+            if not self._buckets or self._buckets[-1][0] != second:
+                self._buckets.append([second, 0, 0])
+            self._buckets[-1][1] += 1
+            self._buckets[-1][2] += int(failed)
+
+    def can_retry(self) -> bool:
+        with self._lock:
+            self._trim(int(time.monotonic()))
+            attempts = sum(x[1] for x in self._buckets)
+            failures = sum(x[2] for x in self._buckets)
+        if attempts < self.min_attempts:
+            return True
+        return failures / attempts <= self.max_failure_rate
+
+    def _trim(self, second: int) -> None:
+        while self._buckets and self._buckets[0][0] <= second - self.window:
+            self._buckets.popleft()
+
+
+class _RetryPolicy:
+    def __init__(
+        self,
+        name: str,
+        max_attempts: int,
+        delay: float,
+        backoff: float,
+        max_delay: Optional[float],
+        jitter: float,
+        budget: Optional[RetryBudget],
+    ) -> None:
+        self.name = name
+        self.max_attempts = max_attempts
+        self.delay = delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.budget = budget
+
+    def wait(self, attempts: int) -> float:
+        wait = self.delay * self.backoff ** (attempts - 1)
+        if self.max_delay is not None:
+            wait = min(wait, self.max_delay)
+        return wait * (1 - self.jitter * random.random())
+
+    def on_error(self, attempts: int, e: BaseException) -> Optional[float]:
+        """Seconds to wait before the next attempt, None to give up."""
+        if self.budget is not None:
+            self.budget.record(failed=True)
+        if attempts >= self.max_attempts:
+            return None
+        if self.budget is not None and not self.budget.can_retry():
+            log.error(f">>>{self.name} Attempt {attempts} failed. Retry budget exhausted.")
+            return None
+        wait = self.wait(attempts)
+        log.error(f">>>{self.name} Attempt {attempts} failed: {e!r}. Retry in {wait:.2f} seconds.")
+        return wait
+
+    def on_success(self) -> None:
+        if self.budget is not None:
+            self.budget.record(failed=False)
+
+
+def retry(
+    max_attempts: int,
+    delay: float,
+    backoff: float = 1.0,
+    max_delay: Optional[float] = None,
+    jitter: float = 0.0,
+    exceptions: Tuple[Type[BaseException], ...] = (Exception,),
+    budget: Optional[RetryBudget] = None,
+):
+    """
+    Retry sync or async functions raising one of `exceptions`.
+
+    The n-th retry waits `delay * backoff ** (n - 1)` seconds, capped at `max_delay`,
+    `jitter` (0 to 1) randomly shortens waits by up to that fraction.
+    With a shared `budget` retries stop while its failure rate is too high.
+    The last error is re-raised when attempts run out.
+    """
+
     def decorator(fn: Callable):
+        policy = _RetryPolicy(fn.__name__, max_attempts, delay, backoff, max_delay, jitter, budget)
+
+        async def async_wrapper(*args, **kwargs):
+            attempts = 0
+            while True:
+                attempts += 1
+                try:
+                    result = await fn(*args, **kwargs)
+                except exceptions as e:
+                    wait = policy.on_error(attempts, e)
+                    if wait is None:
+                        raise
+                    await asyncio.sleep(wait)
+                else:
+                    policy.on_success()
+                    return result
 
         def sync_wrapper(*args, **kwargs):
             attempts = 0
-            error = None
-            while attempts < max_attempts:
+            while True:
+                attempts += 1
                 try:
-                    return fn(*args, **kwargs)
-                except Exception as e:
-                    log.error(
-                        f">>>{fn.__name__} Attempt {attempts + 1} failed. "
-                        f"Retry in {delay} seconds."
-                    )
-                    attempts += 1
-                    time.sleep(delay)
-                    error = e
-            raise Exception(f">>> Max attempts exceeded.\nError: {error}")
+                    result = fn(*args, **kwargs)
+                except exceptions as e:
+                    wait = policy.on_error(attempts, e)
+                    if wait is None:
+                        raise
+                    time.sleep(wait)
+                else:
+                    policy.on_success()
+                    return result
 
-        return sync_wrapper
+        if asyncio.iscoroutinefunction(fn):
+            return async_wrapper
+        else:
+            return sync_wrapper
 
     return decorator
 
 
+def _parse_pg_connection(pg_conn: str) -> Tuple:
+    regex = '(.+):(.+)@(.+):(.+)'
+    matches = re.match(regex, pg_conn, re.M | re.I)
+    if matches is None:
+        raise Exception("Invalid Postgres connection string!")
+    user, password, host, port = matches.groups()
+    return user, password, host, port
+
+
 def connect_pg(postgres, dbname):
 
     import psycopg2
 
-    def parse_pg_connection(pg_conn) -> Tuple:
-        regex = '(.+):(.+)@(.+):(.+)'
-        matches = re.match(regex, pg_conn, re.M | re.I)
-        if matches is None:
-            raise Exception("Invalid Postgres connection string!")
-        user, password, host, port = matches.groups()
-        return user, password, host, port
+    user, password, host, port = _parse_pg_connection(postgres)
 
     def decorator(function):
         def wrapper(**kwargs):
-            user, password, host, port = parse_pg_connection(postgres)
             con = psycopg2.connect(
                 user=user, password=password, host=host, port=port, database=dbname
             )
             logging.info("Database opened successfully")
-            cur = con.cursor()
-            result = function(cur=cur, **kwargs)
+            try:
+                cur = con.cursor()
+                result = function(cur=cur, **kwargs)
+                con.commit()
+            except BaseException:
+                con.rollback()
+                raise
+            finally:
+                con.close()
+                logging.info("Database closed successfully")
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def _ping(con: Any) -> bool:
+    cur = con.cursor()
+    try:
+        cur.execute("SELECT 1")
+        cur.fetchall()
+    finally:
+        cur.close()
+    return True
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of DB-API connections created by `connect`.
+
+    `min_size` connections are opened upfront and kept,
+    other idle connections are closed after `idle_timeout` seconds.
+    Connections are checked with `health_check` when checked out,
+    `acquire` waits up to `timeout` seconds for one when `max_size` are in use.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        min_size: int = 1,
+        max_size: int = 10,
+        idle_timeout: Optional[float] = 300.0,
+        health_check: Optional[Callable[[Any], bool]] = _ping,
+        timeout: Optional[float] = None,
+    ) -> None:
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check = health_check
+        self.timeout = timeout
+        self._idle: Deque[Tuple[Any, float]] = deque()  # (connection, released at)
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        for _ in range(min_size):
+            self._size += 1
+            self._idle.append((connect(), time.monotonic()))
+
+    def acquire(self, timeout: Optional[float] = None) -> Any:
+        timeout = self.timeout if timeout is None else timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            con, create = self._checkout(deadline)
+            if create is True:
+                try:
+                    return self.connect()
+                except BaseException:
+                    self._discard(None)
+                    raise
+            if self._is_healthy(con):
+                return con
+            self._discard(con)
+
+    def release(self, con: Any, discard: bool = False) -> None:
+        if discard is True or self._closed:
+            self._discard(con)
+            return
+        with self._condition:
+            self._idle.append((con, time.monotonic()))
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[Any]:
+        """Check out a connection, commit on success, roll back on error."""
+        con = self.acquire(timeout)
+        try:
+            yield con
             con.commit()
+        except BaseException:
+            discard = False
+            try:
+                con.rollback()
+            except Exception as e:
+                log.warning(f"Rollback failed: {e}")
+                discard = True
+            self.release(con, discard=discard)
+            raise
+        self.release(con)
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            idle = [con for con, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for con in idle:
+            self._close(con)
+
+    def _checkout(self, deadline: Optional[float]) -> Tuple[Any, bool]:
+        con, create = None, False
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed!")
+                expired = self._pop_expired()
+                if self._idle:
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    create = True
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"No connection available in {self.max_size} connections!")
+                self._condition.wait(remaining)
+            if create is False:
+                con, _ = self._idle.pop()
+        for expired_con in expired:
+            self._close(expired_con)
+        return con, create
+
+    def _pop_expired(self) -> List[Any]:
+        expired: List[Any] = []
+        if self.idle_timeout is None:
+            return expired
+        now = time.monotonic()
+        while (
+            self._idle and self._size > self.min_size and now - self._idle[0][1] > self.idle_timeout
+        ):
+            expired.append(self._idle.popleft()[0])
+            self._size -= 1
+        return expired
+
+    def _is_healthy(self, con: Any) -> bool:
+        if self.health_check is None:
+            return True
+        try:
+            return bool(self.health_check(con))
+        except Exception:
+            return False
+
+    def _discard(self, con: Any) -> None:
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+        if con is not None:
+            self._close(con)
+
+    @staticmethod
+    def _close(con: Any) -> None:
+        try:
             con.close()
-            logging.info("Database closed successfully")
-            return result
+        except Exception as e:
+            log.warning(f"Closing connection failed: {e}")
+
+
+def pg_pool(postgres: str, dbname: str, **kwargs) -> ConnectionPool:
+    """ConnectionPool of psycopg2 connections, `postgres` as in `connect_pg`."""
+    import psycopg2
+
+    user, password, host, port = _parse_pg_connection(postgres)
+
+    def _connect() -> Any:
+        return psycopg2.connect(user=user, password=password, host=host, port=port, database=dbname)
+
+    return ConnectionPool(_connect, **kwargs)
+
+
+def connect_pool(pool: ConnectionPool):
+    """Pooled `connect_pg`: the function gets a cursor as `cur`."""
+
+    def decorator(function):
+        def wrapper(**kwargs):
+            with pool.connection() as con:
+                cur = con.cursor()
+                try:
+                    return function(cur=cur, **kwargs)
+                finally:
+                    cur.close()
 
         return wrapper
 
@@ -91,6 +620,13 @@ def connect_pg(postgres, dbname):
 
 
 def proxy(http_proxy: str = "", https_proxy: str = "", all_proxy: str = ""):
+    """
+    Set the proxy environment variables during the call.
+
+    They are process-wide, concurrent calls overwrite each other's settings,
+    use `scoped_proxy` with `get_proxies` instead when calls run in parallel.
+    """
+
     def decorator(fn: Callable):
         def _get_proxy():
             http_proxy = os.environ.get("http_proxy", "")
@@ -115,3 +651,793 @@ def proxy(http_proxy: str = "", https_proxy: str = "", all_proxy: str = ""):
         return sync_wrapper
 
     return decorator
+
+
+class ProxySettings(NamedTuple):
+    http_proxy: str = ""
+    https_proxy: str = ""
+    all_proxy: str = ""
+
+
+_proxy_settings: ContextVar[Optional[ProxySettings]] = ContextVar("proxy_settings", default=None)
+
+
+def get_proxy_settings() -> Optional[ProxySettings]:
+    return _proxy_settings.get()
+
+
+def get_proxies() -> Dict[str, str]:
+    """
+    Proxies of the current `proxy_scope` as a `proxies` mapping for HTTP clients,
+    e.g. `requests.get(url, proxies=get_proxies())`.
+    """
+    settings = _proxy_settings.get()
+    if settings is None:
+        return {}
+    proxies = {
+        "http": settings.http_proxy,
+        "https": settings.https_proxy,
+        "all": settings.all_proxy,
+    }
+    return {k: v for k, v in proxies.items() if v}
+
+
+@contextmanager
+def proxy_scope(
+    http_proxy: str = "", https_proxy: str = "", all_proxy: str = ""
+) -> Iterator[ProxySettings]:
+    """Proxy settings visible to the current thread or task only."""
+    settings = ProxySettings(http_proxy, https_proxy, all_proxy)
+    token = _proxy_settings.set(settings)
+    try:
+        yield settings
+    finally:
+        _proxy_settings.reset(token)
+
+
+def scoped_proxy(http_proxy: str = "", https_proxy: str = "", all_proxy: str = ""):
+    """Run sync or async functions inside a `proxy_scope`, leaving os.environ untouched."""
+
+    def decorator(fn: Callable):
+        async def async_wrapper(*args, **kwargs) -> Any:
+            with proxy_scope(http_proxy, https_proxy, all_proxy):
+                return await fn(*args, **kwargs)
+
+        def sync_wrapper(*args, **kwargs) -> Any:
+            with proxy_scope(http_proxy, https_proxy, all_proxy):
+                return fn(*args, **kwargs)
+
+        if asyncio.iscoroutinefunction(fn):
+            return async_wrapper
+        else:
+            return sync_wrapper
+
+    return decorator
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    entries: int
+    bytes: int
+
+
+class _DiskCache:
+    """Entries of the functions sharing a sqlite file, keyed by `namespace`."""
+
+    def __init__(self, path: str | Path, namespace: str) -> None:
+        import sqlite3
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.namespace = namespace
+        self._con = sqlite3.connect(str(path), check_same_thread=False)
+        self._con.execute(
+            "CREATE TABLE IF NOT EXISTS entries (namespace TEXT, key BLOB, value BLOB, "
+            "expires_at REAL, PRIMARY KEY (namespace, key))"
+        )
+        self._con.commit()
+        self._lock = threading.Lock()
+
+    def get(self, key: bytes) -> Tuple[bool, Any, float]:
+        with self._lock:
+            row = self._con.execute(
+                "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+        if row is None:
+            return False, None, math.inf
+        value, expires_at = row
+        return True, pickle.loads(value), math.inf if expires_at is None else expires_at
+
+    def set(self, key: bytes, value: Any, expires_at: float) -> None:
+        data = pickle.dumps(value)
+        with self._lock:
+            self._con.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                (self.namespace, key, data, None if expires_at == math.inf else expires_at),
+            )
+            self._con.commit()
+
+    def delete(self, key: bytes) -> None:
+        with self._lock:
+            self._con.execute(
+                "DELETE FROM entries WHERE namespace = ? AND key = ?", (self.namespace, key)
+            )
+            self._con.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._con.execute("DELETE FROM entries WHERE namespace = ?", (self.namespace,))
+            self._con.commit()
+
+
+class _Cache:
+    def __init__(
+        self,
+        ttl: Optional[float],
+        max_entries: Optional[int],
+        max_bytes: Optional[int],
+        sizeof: Callable[[Any], int],
+        disk_path: Optional[str | Path],
+        namespace: str,
+    ) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._disk = None if disk_path is None else _DiskCache(disk_path, namespace)
+        self._entries: OrderedDict[Hashable, Tuple[Any, float, int]] = OrderedDict()
+        self._bytes = 0
+        self._hits = self._misses = self._evictions = self._expirations = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return True, entry[0]
+                self._remove(key)
+                self._expirations += 1
+        if self._disk is not None:
+            found, value, expires_at = self._disk.get(pickle.dumps(key))
+            if found and expires_at > now:
+                with self._lock:
+                    self._store(key, value, expires_at)
+                    self._hits += 1
+                return True, value
+            if found:
+                self._disk.delete(pickle.dumps(key))
+        with self._lock:
+            self._misses += 1
+        return False, None
+
+    def set(self, key: Hashable, value: Any) -> None:
+        expires_at = math.inf if self.ttl is None else time.time() + self.ttl
+        with self._lock:
+            self._store(key, value, expires_at)
+        if self._disk is not None:
+            self._disk.set(pickle.dumps(key), value, expires_at)
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                expirations=self._expirations,
+                entries=len(self._entries),
+                bytes=self._bytes,
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._hits = self._misses = self._evictions = self._expirations = 0
+        if self._disk is not None:
+            self._disk.clear()
+
+    def _store(self, key: Hashable, value: Any, expires_at: float) -> None:
+        if key in self._entries:
+            self._remove(key)
+        n_bytes = self.sizeof(value) if self.max_bytes is not None else 0
+        self._entries[key] = (value, expires_at, n_bytes)
+        self._bytes += n_bytes
+        while self._entries and (
+            (self.max_entries is not None and len(self._entries) > self.max_entries)
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            self._remove(next(iter(self._entries)))
+            self._evictions += 1
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, n_bytes = self._entries.pop(key)
+        self._bytes -= n_bytes
+
+
+_LEADER_CANCELLED = object()
+
+
+def _make_key(args: Tuple, kwargs: Dict[str, Any]) -> Hashable:
+    if not kwargs:
+        return args
+    return args, tuple(sorted(kwargs.items()))
+
+
+def cached(
+    ttl: Optional[float] = None,
+    max_entries: Optional[int] = 128,
+    max_bytes: Optional[int] = None,
+    sizeof: Callable[[Any], int] = sys.getsizeof,
+    disk_path: Optional[str | Path] = None,
+):
+    """
+    Memoize sync or async functions by their (hashable) arguments.
+
+    Entries expire after `ttl` seconds, the least recently used ones are evicted
+    beyond `max_entries` or `max_bytes` as measured by `sizeof`.
+    Concurrent calls with the same arguments share a single computation.
+    With `disk_path` entries are also pickled to a sqlite file and survive restarts,
+    the file is only bounded by `ttl` and can be shared by several functions.
+    The wrapper has `cache_info()` and `cache_clear()` like functools.lru_cache.
+    """
+
+    def decorator(fn: Callable):
+        namespace = f"{fn.__module__}.{fn.__qualname__}"
+        cache = _Cache(ttl, max_entries, max_bytes, sizeof, disk_path, namespace)
+        inflight: Dict[Hashable, Future] = {}
+        inflight_lock = threading.Lock()
+        async_inflight: Dict[Tuple[asyncio.AbstractEventLoop, Hashable], asyncio.Future] = {}
+
+        async def async_wrapper(*args, **kwargs) -> Any:
+            key = _make_key(args, kwargs)
+            loop = asyncio.get_running_loop()
+            flight_key = (loop, key)
+            while True:
+                found, value = cache.get(key)
+                if found:
+                    return value
+                future = async_inflight.get(flight_key)
+                if future is None:
+                    break
+                value = await asyncio.shield(future)
+                if value is not _LEADER_CANCELLED:
+                    return value
+            future = async_inflight[flight_key] = loop.create_future()
+            try:
+                value = await fn(*args, **kwargs)
+            except asyncio.CancelledError:
+                # Followers were not cancelled, one of them takes over.
+                async_inflight.pop(flight_key, None)
+                future.set_result(_LEADER_CANCELLED)
+                raise
+            except BaseException as e:
+                async_inflight.pop(flight_key, None)
+                future.set_exception(e)
+                future.exception()  # retrieved by the caller raising it
+                raise
+            cache.set(key, value)
+            async_inflight.pop(flight_key, None)
+            future.set_result(value)
+            return value
+
+        def sync_wrapper(*args, **kwargs) -> Any:
+            key = _make_key(args, kwargs)
+            found, value = cache.get(key)
+            if found:
+                return value
+            with inflight_lock:
+                future = inflight.get(key)
+                leader = future is None
+                if future is None:
+                    future = inflight[key] = Future()
+            if leader is False:
+                return future.result()
+            try:
+                value = fn(*args, **kwargs)
+            except BaseException as e:
+                with inflight_lock:
+                    inflight.pop(key, None)
+                future.set_exception(e)
+                raise
+            cache.set(key, value)
+            with inflight_lock:
+                inflight.pop(key, None)
+            future.set_result(value)
+            return value
+
+        wrapper: Any = async_wrapper if asyncio.iscoroutinefunction(fn) else sync_wrapper
+        wrapper.cache_info = cache.info
+        wrapper.cache_clear = cache.clear
+        return wrapper
+
+    return decorator
+
+
+class RateLimiter:
+    """
+    Token bucket allowing `rate` calls per second with bursts of up to `burst`.
+
+    Each caller reserves the next free slot under a short lock
+    and then sleeps outside it, so waiters are served in arrival order
+    across threads and event loops.
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token, return the seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self) -> None:
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class ConcurrencyLimiter:
+    """
+    At most `max_in_flight` concurrent holders, shared by threads and event loops.
+
+    Waiters are woken in FIFO order and a released slot is handed over directly.
+    """
+
+    def __init__(self, max_in_flight: int) -> None:
+        self.max_in_flight = max_in_flight
+        self._in_flight = 0
+        self._waiters: Deque[Any] = deque()  # threading.Event or (loop, asyncio.Future)
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self) -> None:
+        with self._lock:
+            if self._in_flight < self.max_in_flight and not self._waiters:
+                self._in_flight += 1
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        event.wait()
+
+    async def acquire_async(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._in_flight < self.max_in_flight and not self._waiters:
+                self._in_flight += 1
+                return
+            future = loop.create_future()
+            waiter = (loop, future)
+            self._waiters.append(waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                handed_over = waiter not in self._waiters
+                if not handed_over:
+                    self._waiters.remove(waiter)
+            if handed_over:
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    return
+                loop, future = waiter
+                try:
+                    loop.call_soon_threadsafe(_set_future_result, future)
+                    return
+                except RuntimeError:  # the waiter's loop is closed
+                    continue
+            self._in_flight -= 1
+
+
+def _set_future_result(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+_rate_limiters: Dict[Hashable, RateLimiter] = {}
+_concurrency_limiters: Dict[Hashable, ConcurrencyLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(key: Hashable, rate: float, burst: int = 1) -> RateLimiter:
+    """RateLimiter shared by everything using `key`, made with the first settings."""
+    with _limiters_lock:
+        if key not in _rate_limiters:
+            _rate_limiters[key] = RateLimiter(rate, burst)
+        return _rate_limiters[key]
+
+
+def get_concurrency_limiter(key: Hashable, max_in_flight: int) -> ConcurrencyLimiter:
+    """ConcurrencyLimiter shared by everything using `key`, made with the first settings."""
+    with _limiters_lock:
+        if key not in _concurrency_limiters:
+            _concurrency_limiters[key] = ConcurrencyLimiter(max_in_flight)
+        return _concurrency_limiters[key]
+
+
+def rate_limit(rate: float, burst: int = 1, key: Optional[Hashable] = None):
+    """
+    Limit sync or async calls to `rate` per second with bursts of `burst`,
+    functions with the same `key` share one limiter.
+    """
+
+    def decorator(fn: Callable):
+        limiter = RateLimiter(rate, burst) if key is None else get_rate_limiter(key, rate, burst)
+
+        async def async_wrapper(*args, **kwargs) -> Any:
+            await limiter.acquire_async()
+            return await fn(*args, **kwargs)
+
+        def sync_wrapper(*args, **kwargs) -> Any:
+            limiter.acquire()
+            return fn(*args, **kwargs)
+
+        if asyncio.iscoroutinefunction(fn):
+            return async_wrapper
+        else:
+            return sync_wrapper
+
+    return decorator
+
+
+def limit_concurrency(max_in_flight: int, key: Optional[Hashable] = None):
+    """
+    Allow at most `max_in_flight` concurrent sync or async calls,
+    functions with the same `key` share one limiter.
+    """
+
+    def decorator(fn: Callable):
+        limiter = (
+            ConcurrencyLimiter(max_in_flight)
+            if key is None
+            else get_concurrency_limiter(key, max_in_flight)
+        )
+
+        async def async_wrapper(*args, **kwargs) -> Any:
+            await limiter.acquire_async()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                limiter.release()
+
+        def sync_wrapper(*args, **kwargs) -> Any:
+            limiter.acquire()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                limiter.release()
+
+        if asyncio.iscoroutinefunction(fn):
+            return async_wrapper
+        else:
+            return sync_wrapper
+
+    return decorator
+
+
+def _batch_results(keys: List[Hashable], results: Any) -> List[Any]:
+    if isinstance(results, dict):
+        return [results[key] if key in results else KeyError(key) for key in keys]
+    results = list(results)
+    if len(results) != len(keys):
+        raise ValueError(f"Batch function returned {len(results)} results for {len(keys)} keys!")
+    return results
+
+
+class _ThreadBatcher:
+    def __init__(self, fn: Callable, max_size: int, max_wait: float) -> None:
+        self.fn = fn
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._pending: Dict[Hashable, Future] = {}
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def load(self, key: Hashable) -> Any:
+        batch = None
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pending[key] = Future()
+                if len(self._pending) >= self.max_size:
+                    batch = self._take()
+                elif self._timer is None:
+                    self._timer = threading.Timer(self.max_wait, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+        if batch is not None:
+            self._run(batch)
+        return future.result()
+
+    def flush(self) -> None:
+        with self._lock:
+            batch = self._take()
+        self._run(batch)
+
+    def _take(self) -> Dict[Hashable, Future]:
+        batch, self._pending = self._pending, {}
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def _run(self, batch: Dict[Hashable, Future]) -> None:
+        if not batch:
+            return
+        keys = list(batch.keys())
+        try:
+            results = _batch_results(keys, self.fn(keys))
+        except BaseException as e:
+            for future in batch.values():
+                future.set_exception(e)
+            return
+        for future, result in zip(batch.values(), results):
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+class _AsyncBatcher:
+    def __init__(self, fn: Callable, max_size: int, max_wait: float) -> None:
+        self.fn = fn
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._pending: Dict[asyncio.AbstractEventLoop, Dict[Hashable, asyncio.Future]] = {}
+        self._timers: Dict[asyncio.AbstractEventLoop, asyncio.TimerHandle] = {}
+        # The loop only keeps weak references to tasks.
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def load(self, key: Hashable) -> Any:
+        loop = asyncio.get_running_loop()
+        pending = self._pending.setdefault(loop, {})
+        future = pending.get(key)
+        if future is None:
+            future = pending[key] = loop.create_future()
+            if len(pending) >= self.max_size:
+                self.flush(loop)
+            elif loop not in self._timers:
+                self._timers[loop] = loop.call_later(self.max_wait, self.flush, loop)
+        return await asyncio.shield(future)
+
+    def flush(self, loop: asyncio.AbstractEventLoop) -> None:
+        timer = self._timers.pop(loop, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(loop, {})
+        if batch:
+            task = loop.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: Dict[Hashable, asyncio.Future]) -> None:
+        keys = list(batch.keys())
+        try:
+            results = _batch_results(keys, await self.fn(keys))
+        except BaseException as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return
+        for future, result in zip(batch.values(), results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+def batched(max_size: int = 100, max_wait: float = 0.01):
+    """
+    Turn a batch function `fn(keys) -> results` into a single-key `fn(key) -> result`.
+
+    Keys requested by concurrent threads or tasks are collected into one call
+    of at most `max_size` unique keys, waiting at most `max_wait` seconds.
+    Results are a list aligned with the keys or a dict by key,
+    an exception given as a result is raised to that key's caller only.
+    """
+
+    def decorator(fn: Callable):
+        if asyncio.iscoroutinefunction(fn):
+            async_batcher = _AsyncBatcher(fn, max_size, max_wait)
+
+            async def async_wrapper(key: Hashable) -> Any:
+                return await async_batcher.load(key)
+
+            return async_wrapper
+
+        batcher = _ThreadBatcher(fn, max_size, max_wait)
+
+        def sync_wrapper(key: Hashable) -> Any:
+            return batcher.load(key)
+
+        return sync_wrapper
+
+    return decorator
+
+
+_ExecutorKind = Literal[
+    "thread",
+    "process",
+]
+
+_executors: Dict[str, Executor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(kind: _ExecutorKind = "thread") -> Executor:
+    """Shared thread or process pool, created with default size on first use."""
+    with _executors_lock:
+        if kind not in _executors:
+            if kind == "thread":
+                _executors[kind] = ThreadPoolExecutor()
+            else:
+                from concurrent.futures import ProcessPoolExecutor
+
+                _executors[kind] = ProcessPoolExecutor()
+        return _executors[kind]
+
+
+def set_executor(kind: _ExecutorKind, executor: Executor) -> None:
+    """Replace the shared pool of `kind`, the previous one is shut down."""
+    with _executors_lock:
+        previous = _executors.get(kind)
+        _executors[kind] = executor
+    if previous is not None and previous is not executor:
+        previous.shutdown(wait=False)
+
+
+def _call_unwrapped(module: str, qualname: str, args: Tuple, kwargs: Dict[str, Any]) -> Any:
+    # Decorated functions cannot be pickled by reference,
+    # process workers look the original up through __wrapped__.
+    obj: Any = importlib.import_module(module)
+    for name in qualname.split("."):
+        obj = getattr(obj, name)
+    return getattr(obj, "__wrapped__", obj)(*args, **kwargs)
+
+
+def offload(kind: _ExecutorKind = "thread", executor: Optional[Executor] = None):
+    """
+    Make a blocking sync function awaitable by running it in `executor`,
+    the shared pool of `kind` by default. Async functions are left as they are.
+    Process pools require a module-level function.
+    """
+
+    def decorator(fn: Callable):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs) -> Any:
+            return await fn(*args, **kwargs)
+
+        @functools.wraps(fn)
+        async def offload_wrapper(*args, **kwargs) -> Any:
+            pool = get_executor(kind) if executor is None else executor
+            loop = asyncio.get_running_loop()
+            if not isinstance(pool, ThreadPoolExecutor):
+                call = functools.partial(
+                    _call_unwrapped, fn.__module__, fn.__qualname__, args, kwargs
+                )
+            else:
+                call = functools.partial(fn, *args, **kwargs)
+            return await loop.run_in_executor(pool, call)
+
+        if asyncio.iscoroutinefunction(fn):
+            return async_wrapper
+        else:
+            return offload_wrapper
+
+    return decorator
+
+
+def _map_chunk(fn: Callable, chunk: List[Any]) -> List[Any]:
+    return [fn(x) for x in chunk]
+
+
+def _chunked(iterable: Iterable[Any], chunksize: int) -> Iterator[List[Any]]:
+    chunk: List[Any] = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def parallel_map(
+    fn: Callable,
+    iterable: Iterable[Any],
+    kind: _ExecutorKind = "thread",
+    executor: Optional[Executor] = None,
+    chunksize: int = 1,
+    ordered: bool = True,
+    max_in_flight: Optional[int] = None,
+    progress: bool = False,
+) -> Iterator[Any]:
+    """
+    Lazily map `fn` over `iterable` in `executor`, the shared pool of `kind` by default.
+
+    Items are submitted in chunks of `chunksize`, at most `max_in_flight` chunks
+    (twice the pool size by default) are pending so memory stays bounded.
+    Results are yielded in input order, or as they complete if `ordered` is False.
+    `progress` shows a rich progress bar.
+    """
+    pool = get_executor(kind) if executor is None else executor
+    if max_in_flight is None:
+        max_in_flight = 2 * (getattr(pool, "_max_workers", None) or os.cpu_count() or 1)
+    total = len(iterable) if hasattr(iterable, "__len__") else None  # type: ignore
+    chunks = _chunked(iterable, chunksize)
+    pending: Deque[Future] = deque()
+    progress_bar = None
+    if progress is True:
+        from rich.progress import Progress
+
+        progress_bar = Progress()
+        task = progress_bar.add_task(getattr(fn, "__name__", "parallel_map"), total=total)
+        progress_bar.start()
+
+    def _submit() -> bool:
+        chunk = next(chunks, None)
+        if chunk is None:
+            return False
+        pending.append(pool.submit(_map_chunk, fn, chunk))
+        return True
+
+    def _done(future: Future) -> List[Any]:
+        results = future.result()
+        if progress_bar is not None:
+            progress_bar.advance(task, len(results))
+        return results
+
+    try:
+        while len(pending) < max_in_flight and _submit():
+            pass
+        while pending:
+            if ordered is True:
+                done = [pending.popleft()]
+            else:
+                done_set, _ = wait(pending, return_when=FIRST_COMPLETED)
+                done = [x for x in pending if x in done_set]
+                for future in done:
+                    pending.remove(future)
+            for future in done:
+                yield from _done(future)
+                _submit()
+    finally:
+        for future in pending:
+            future.cancel()
+        if progress_bar is not None:
+            progress_bar.stop()
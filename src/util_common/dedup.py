@@ -0,0 +1,137 @@
+import hashlib
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from util_common.path import IGNORE_NAMES, FileEntry, remove_file, walk_files
+
+BLOCK_SIZE = 64 * 1024
+
+
+class DuplicateGroup(NamedTuple):
+    size: int
+    digest: str
+    paths: List[str]
+
+
+def _hash_blocks(path: str, size: int, algorithm: str, block_size: int) -> str:
+    """Digest of the first and last `block_size` bytes, the whole file if it is smaller."""
+    h = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        if size <= 2 * block_size:
+            h.update(f.read())
+        else:
+            h.update(f.read(block_size))
+            f.seek(-block_size, os.SEEK_END)
+            h.update(f.read(block_size))
+    return h.hexdigest()
+
+
+def _hash_full(path: str, size: int, algorithm: str, block_size: int) -> str:
+    h = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return h.hexdigest()  # an empty file cannot be mapped
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            h.update(m)
+    return h.hexdigest()
+
+
+def _refine(
+    groups: List[List[FileEntry]],
+    hash_fn: Callable[[str, int, str, int], str],
+    algorithm: str,
+    block_size: int,
+    executor: ThreadPoolExecutor,
+) -> List[Tuple[str, List[FileEntry]]]:
+    """Split each group by the digest of its files, keeping only the digests shared by several."""
+
+    def _hash(entry: FileEntry) -> Optional[str]:
+        try:
+            return hash_fn(entry.path, entry.size, algorithm, block_size)
+        except (OSError, ValueError):  # ValueError: mmap of a file truncated since the walk
+            return None
+
+    from util_common.decorator import parallel_map
+
+    # The files of all the groups are hashed together to keep every worker busy,
+    # with a bounded number of pending hashes.
+    entries = [x for group in groups for x in group]
+    by_digest: Dict[Tuple[int, str], List[FileEntry]] = {}
+    for entry, digest in zip(entries, parallel_map(_hash, entries, executor=executor)):
+        if digest is not None:
+            by_digest.setdefault((entry.size, digest), []).append(entry)
+    return [(digest, x) for (_, digest), x in by_digest.items() if len(x) > 1]
+
+
+def find_duplicates(
+    folder: str | Path,
+    min_size: int = 1,
+    algorithm: str = "sha256",
+    block_size: int = BLOCK_SIZE,
+    ignore_names: Sequence[str] = IGNORE_NAMES,
+    max_workers: int = 8,
+) -> List[DuplicateGroup]:
+    """
+    Find the files under `folder` with identical content.
+
+    Files are grouped by size, then by a digest of their first and last
+    `block_size` bytes, and only the remaining candidates are fully hashed,
+    so most files are never read completely. Hard links to the same file
+    (device and inode) count once. Paths in each group are sorted, the groups wasting the most
+    bytes come first.
+    """
+    by_size: Dict[int, Dict[Tuple[int, int], FileEntry]] = {}
+    for entry in walk_files(folder, ignore_names=ignore_names, max_workers=max_workers):
+        if entry.size >= min_size:
+            by_size.setdefault(entry.size, {}).setdefault((entry.dev, entry.inode), entry)
+    candidates = [list(x.values()) for x in by_size.values() if len(x) > 1]
+    del by_size
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        partial = _refine(candidates, _hash_blocks, algorithm, block_size, executor)
+        del candidates
+        complete = [x for x in partial if x[1][0].size <= 2 * block_size]
+        remaining = [x[1] for x in partial if x[1][0].size > 2 * block_size]
+        complete.extend(_refine(remaining, _hash_full, algorithm, block_size, executor))
+    groups = [
+        DuplicateGroup(entries[0].size, digest, sorted(x.path for x in entries))
+        for digest, entries in complete
+    ]
+    groups.sort(key=lambda x: (-x.size * (len(x.paths) - 1), x.paths[0]))
+    return groups
+
+
+def _hardlink(src_path: str, dst_path: str) -> None:
+    tmp_path = f"{dst_path}.dedup-{os.getpid()}"
+    os.link(src_path, tmp_path)
+    try:
+        os.replace(tmp_path, dst_path)
+    except OSError:
+        os.remove(tmp_path)
+        raise
+
+
+def remove_duplicates(
+    groups: Iterable[DuplicateGroup],
+    hardlink: bool = False,
+    trash_dir: Optional[Path | str] = None,
+) -> int:
+    """
+    Keep the first path of each group and remove the others, returning the bytes freed.
+
+    With `hardlink` the duplicates are replaced by hard links to the kept file,
+    otherwise they are removed with `remove_file`, moved to `trash_dir` if given.
+    """
+    n_bytes = 0
+    for group in groups:
+        original, *duplicates = group.paths
+        for path in duplicates:
+            if hardlink:
+                _hardlink(original, path)
+            else:
+                remove_file(path, trash_dir=trash_dir)
+            n_bytes += group.size
+    return n_bytes
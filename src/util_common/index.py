@@ -0,0 +1,174 @@
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from util_common._log import log
+from util_common.path import IGNORE_NAMES, FileEntry, ensure_parent, hash_file, walk_files
+
+SCAN_BATCH_SIZE = 500
+
+
+class IndexChanges(NamedTuple):
+    added: List[str]
+    modified: List[str]
+    deleted: List[str]
+
+
+class IndexedFile(NamedTuple):
+    size: int
+    mtime: float
+    inode: int
+    hash: Optional[str]
+
+
+def _iter_batches(entries: Iterator[FileEntry], size: int) -> Iterator[List[FileEntry]]:
+    while True:
+        batch = list(islice(entries, size))
+        if not batch:
+            return
+        yield batch
+
+
+class DirectoryIndex:
+    """
+    On-disk index of the files under `root`, kept in a sqlite file at `index_path`.
+
+    `scan` walks the tree and reports the files added, modified and deleted
+    since the previous scan. Files whose size, mtime and inode are unchanged
+    are not read, with `hash_content` the others are hashed so that touched
+    but identical files are not reported as modified. The files under a folder
+    that cannot be read are kept as indexed, not reported as deleted.
+    """
+
+    def __init__(
+        self,
+        root: str | Path,
+        index_path: str | Path,
+        hash_content: bool = False,
+        algorithm: str = "sha256",
+        ignore_names: Sequence[str] = IGNORE_NAMES,
+        max_workers: int = 8,
+    ) -> None:
+        self.root = str(root)
+        self.hash_content = hash_content
+        self.algorithm = algorithm
+        self.ignore_names = ignore_names
+        self.max_workers = max_workers
+        ensure_parent(index_path)
+        self._con = sqlite3.connect(str(index_path))
+        self._con.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime REAL, inode INTEGER, "
+            "hash TEXT, scan_id INTEGER)"
+        )
+        self._con.execute("CREATE INDEX IF NOT EXISTS files_scan_id ON files (scan_id)")
+        self._con.commit()
+
+    def __enter__(self) -> "DirectoryIndex":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._con.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def get(self, path: str | Path) -> Optional[IndexedFile]:
+        row = self._con.execute(
+            "SELECT size, mtime, inode, hash FROM files WHERE path = ?",
+            (self._relative(str(path)),),
+        ).fetchone()
+        return None if row is None else IndexedFile(*row)
+
+    def scan(self) -> IndexChanges:
+        scan_id = self._con.execute("SELECT COALESCE(MAX(scan_id), 0) + 1 FROM files").fetchone()[0]
+        changes = IndexChanges([], [], [])
+        failed: List[str] = []
+        entries = walk_files(
+            self.root,
+            ignore_names=self.ignore_names,
+            max_workers=self.max_workers,
+            on_error=lambda e: failed.append(self._relative(str(e.filename))),
+        )
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for batch in _iter_batches(entries, SCAN_BATCH_SIZE):
+                self._scan_batch(batch, scan_id, changes, executor)
+        self._keep_failed(failed, scan_id)
+        deleted = self._con.execute(
+            "SELECT path FROM files WHERE scan_id != ?", (scan_id,)
+        ).fetchall()
+        changes.deleted.extend(os.path.join(self.root, x[0]) for x in deleted)
+        self._con.execute("DELETE FROM files WHERE scan_id != ?", (scan_id,))
+        self._con.commit()
+        return changes
+
+    def close(self) -> None:
+        self._con.close()
+
+    def _relative(self, path: str) -> str:
+        return os.path.relpath(path, self.root)
+
+    def _keep_failed(self, folders: List[str], scan_id: int) -> None:
+        """Keep the rows under `folders` that could not be read, they are not deleted."""
+        for folder in folders:
+            log.warning(f"{os.path.join(self.root, folder)}: not read, its rows are kept")
+            if folder == os.curdir:
+                self._con.execute("UPDATE files SET scan_id = ?", (scan_id,))
+                continue
+            prefix = os.path.join(folder, "")
+            self._con.execute(
+                "UPDATE files SET scan_id = ? WHERE scan_id != ? AND substr(path, 1, ?) = ?",
+                (scan_id, scan_id, len(prefix), prefix),
+            )
+
+    def _hash(self, entry: FileEntry) -> Optional[str]:
+        try:
+            return hash_file(entry.path, self.algorithm)
+        except OSError:
+            return None
+
+    def _scan_batch(
+        self,
+        batch: List[FileEntry],
+        scan_id: int,
+        changes: IndexChanges,
+        executor: ThreadPoolExecutor,
+    ) -> None:
+        paths = [self._relative(x.path) for x in batch]
+        stored: Dict[str, IndexedFile] = {
+            row[0]: IndexedFile(*row[1:])
+            for row in self._con.execute(
+                "SELECT path, size, mtime, inode, hash FROM files "
+                f"WHERE path IN ({', '.join('?' * len(paths))})",
+                paths,
+            )
+        }
+        unchanged: List[Tuple[int, str]] = []
+        changed: List[Tuple[str, FileEntry, Optional[IndexedFile]]] = []
+        for path, entry in zip(paths, batch):
+            indexed = stored.get(path)
+            if indexed is not None and indexed[:3] == (entry.size, entry.mtime, entry.inode):
+                unchanged.append((scan_id, path))
+            else:
+                changed.append((path, entry, indexed))
+
+        hashes: List[Optional[str]]
+        if self.hash_content is True:
+            hashes = list(executor.map(lambda x: self._hash(x[1]), changed))
+        else:
+            hashes = [None] * len(changed)
+        rows = []
+        for (path, entry, indexed), hash_ in zip(changed, hashes):
+            if self.hash_content is True and hash_ is None:
+                continue  # removed or unreadable since the walk, left out as deleted
+            if indexed is None:
+                changes.added.append(entry.path)
+            elif hash_ is None or hash_ != indexed.hash:
+                changes.modified.append(entry.path)
+            rows.append((path, entry.size, entry.mtime, entry.inode, hash_, scan_id))
+
+        self._con.executemany("UPDATE files SET scan_id = ? WHERE path = ?", unchanged)
+        self._con.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)", rows)
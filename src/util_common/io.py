@@ -1,10 +1,26 @@
 import base64
+import binascii
+import codecs
+import io
 import json
-from typing import Dict, List, Optional
+import re
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
-import magic
+from util_common.path import FileExt, ensure_parent, get_base64_header, guess_extension_from_mime
 
-from util_common.path import FileExt, guess_extension_from_mime
+STREAM_BUFFER_SIZE = 1048576
+B64_ENCODE_CHUNK_SIZE = 3 * 262144  # multiple of 3, encodes to 1 MiB
+B64_DECODE_CHUNK_SIZE = 4 * 262144  # multiple of 4, decodes to 768 KiB
+
+SNIFF_SIZE = 8192  # bytes read to match the signatures
+MAGIC_BYTES_MAX = 1048576  # libmagic does not look further by default
+
+BytesSource = Union[str, Path, IO[bytes], bytes, bytearray, memoryview]
 
 
 def json_to_str(
@@ -27,6 +43,95 @@ def json_to_bytes(
     )
 
 
+def _get_json_dumps_bytes(ensure_ascii=False) -> Callable[[Any], bytes]:
+    if ensure_ascii is False:
+        try:
+            import orjson
+        except ImportError:
+            pass
+        else:
+            return lambda obj: orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    encoder = json.JSONEncoder(ensure_ascii=ensure_ascii, separators=(",", ":"))
+    return lambda obj: encoder.encode(obj).encode("utf-8")
+
+
+def _get_json_loads() -> Callable[[bytes], Any]:
+    try:
+        import orjson
+    except ImportError:
+        return json.loads
+    return orjson.loads
+
+
+def json_to_compact_bytes(json_: Any, ensure_ascii=False) -> bytes:
+    """utf-8 encoded compact JSON, straight to bytes with orjson when installed."""
+    return _get_json_dumps_bytes(ensure_ascii)(json_)
+
+
+@contextmanager
+def _open_binary(file: str | Path | IO[bytes], mode: str) -> Iterator[IO[bytes]]:
+    if isinstance(file, (str, Path)):
+        if "r" not in mode:
+            ensure_parent(file)
+        with open(file, mode, buffering=STREAM_BUFFER_SIZE) as f:
+            yield f
+    else:
+        yield file
+
+
+def write_jsonl(
+    records: Iterable[Any],
+    file: str | Path | IO[bytes],
+    append=False,
+    ensure_ascii=False,
+) -> int:
+    """
+    Write `records` as JSON Lines to a path or binary stream, one at a time.
+
+    Return the number of records written.
+    """
+    dumps = _get_json_dumps_bytes(ensure_ascii)
+    n_records = 0
+    with _open_binary(file, "ab" if append is True else "wb") as f:
+        for record in records:
+            f.write(dumps(record))
+            f.write(b"\n")
+            n_records += 1
+    return n_records
+
+
+def read_jsonl(file: str | Path | IO[bytes]) -> Iterator[Any]:
+    """Lazily yield the records of a JSON Lines path or binary stream."""
+    loads = _get_json_loads()
+    with _open_binary(file, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield loads(line)
+
+
+def write_json_array(
+    records: Iterable[Any],
+    file: str | Path | IO[bytes],
+    ensure_ascii=False,
+) -> int:
+    """
+    Write `records` as one compact JSON array without building it in memory.
+
+    Return the number of records written.
+    """
+    dumps = _get_json_dumps_bytes(ensure_ascii)
+    n_records = 0
+    with _open_binary(file, "wb") as f:
+        f.write(b"[")
+        for record in records:
+            if n_records > 0:
+                f.write(b",")
+            f.write(dumps(record))
+            n_records += 1
+        f.write(b"]")
+    return n_records
+
+
 def str_to_bytes(text: str, encoding="utf-8") -> bytes:
     return bytes(text, encoding=encoding)
 
@@ -43,6 +148,104 @@ def b64str_to_bytes(b64str: str) -> bytes:
     return base64.b64decode(b64str)
 
 
+def _iter_aligned_chunks(src: BytesSource, chunk_size: int) -> Iterator[memoryview]:
+    """
+    Yield `chunk_size` views of `src` (the last one may be shorter).
+
+    Bytes-like sources are sliced without copying, paths and streams are read
+    into one reused buffer, so a chunk is only valid until the next one is taken.
+    """
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        view = memoryview(src).cast("B")
+        for offset in range(0, len(view), chunk_size):
+            yield view[offset : offset + chunk_size]
+        return
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with _open_binary(src, "rb") as f:
+        while True:
+            n_read = 0
+            while n_read < chunk_size:
+                n = f.readinto(view[n_read:])  # type: ignore
+                if not n:
+                    break
+                n_read += n
+            if n_read == 0:
+                return
+            yield view[:n_read]
+            if n_read < chunk_size:
+                return
+
+
+def iter_b64encode(
+    src: BytesSource,
+    chunk_size: int = B64_ENCODE_CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """Base64 encode a path, binary stream or bytes-like object chunk by chunk."""
+    if chunk_size % 3 != 0:
+        raise ValueError(f"chunk_size must be a multiple of 3: {chunk_size}")
+    for chunk in _iter_aligned_chunks(src, chunk_size):
+        yield binascii.b2a_base64(chunk, newline=False)
+
+
+def iter_b64decode(
+    src: BytesSource,
+    chunk_size: int = B64_DECODE_CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """Decode base64 from a path, binary stream or bytes-like object chunk by chunk."""
+    remainder = b""
+    for chunk in _iter_aligned_chunks(src, chunk_size):
+        data = remainder + bytes(chunk).translate(None, b" \t\r\n")
+        n_aligned = len(data) - len(data) % 4
+        remainder = data[n_aligned:]
+        if n_aligned > 0:
+            yield binascii.a2b_base64(data[:n_aligned])
+    if remainder:
+        yield base64.b64decode(remainder)
+
+
+def _write_chunks(chunks: Iterable[bytes], dst: str | Path | IO[bytes], prefix=b"") -> int:
+    n_bytes = 0
+    with _open_binary(dst, "wb") as f:
+        if prefix:
+            n_bytes += f.write(prefix)
+        for chunk in chunks:
+            n_bytes += f.write(chunk)
+    return n_bytes
+
+
+def b64encode_to(
+    src: BytesSource,
+    dst: str | Path | IO[bytes],
+    chunk_size: int = B64_ENCODE_CHUNK_SIZE,
+) -> int:
+    """Base64 encode `src` into `dst` with constant memory, return the bytes written."""
+    return _write_chunks(iter_b64encode(src, chunk_size), dst)
+
+
+def b64decode_to(
+    src: BytesSource,
+    dst: str | Path | IO[bytes],
+    chunk_size: int = B64_DECODE_CHUNK_SIZE,
+) -> int:
+    """Decode base64 `src` into `dst` with constant memory, return the bytes written."""
+    return _write_chunks(iter_b64decode(src, chunk_size), dst)
+
+
+def write_data_url(
+    src: BytesSource,
+    dst: str | Path | IO[bytes],
+    file_extension: str,
+    chunk_size: int = B64_ENCODE_CHUNK_SIZE,
+) -> int:
+    """
+    Write `src` as a `data:{mime};base64,...` URL into `dst`,
+    the mime type is looked up from `file_extension` in MIME_TYPES.
+    """
+    prefix = f"{get_base64_header(file_extension)},".encode("ascii")
+    return _write_chunks(iter_b64encode(src, chunk_size), dst, prefix=prefix)
+
+
 def parse_bool(value: str | int | bool) -> bool:
     if isinstance(value, bool) or isinstance(value, int):
         return bool(value)
@@ -61,7 +264,152 @@ def parse_int(value: str | int | float) -> int:
             raise e
 
 
+# Checked in order against the start of the content,
+# zip and OLE2 containers are refined by looking at their entries.
+FILE_SIGNATURES: List[Tuple[bytes, FileExt]] = [
+    (b"7z\xbc\xaf\x27\x1c", "7z"),
+    (b"Rar!\x1a\x07", "rar"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpg"),
+    (b"%PDF-", "pdf"),
+    (b"PK\x03\x04", "zip"),
+    (b"PK\x05\x06", "zip"),
+    (b"PK\x07\x08", "zip"),
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "doc"),
+]
+
+_OLE_STREAM_NAMES: List[Tuple[bytes, FileExt]] = [
+    ("WordDocument".encode("utf-16-le"), "doc"),
+    ("Workbook".encode("utf-16-le"), "xls"),
+    ("Book".encode("utf-16-le"), "xls"),
+]
+
+_magic_local = threading.local()
+
+
+def _get_magic() -> Any:
+    # libmagic handles are not thread-safe, keep one per thread.
+    magic_ = getattr(_magic_local, "magic", None)
+    if magic_ is None:
+        import magic
+
+        magic_ = _magic_local.magic = magic.Magic(mime=True)
+    return magic_
+
+
+def _sniff_zip(open_zip: Callable[[], zipfile.ZipFile]) -> FileExt:
+    try:
+        with open_zip() as zip_file:
+            names = zip_file.namelist()
+    except (zipfile.BadZipFile, OSError, ValueError):
+        return "zip"
+    if any(x.startswith("word/") for x in names):
+        return "docx"
+    if any(x.startswith("xl/") for x in names):
+        return "xlsx"
+    return "zip"
+
+
+def _sniff_ole(header: bytes, read_at: Callable[[int, int], bytes]) -> Optional[FileExt]:
+    if len(header) < 52:
+        return None
+    sector_size = 1 << int.from_bytes(header[30:32], "little")
+    first_directory_sector = int.from_bytes(header[48:52], "little")
+    directory = read_at((first_directory_sector + 1) * sector_size, sector_size)
+    for name, ext in _OLE_STREAM_NAMES:
+        if name in directory:
+            return ext
+    return None
+
+
+# What a JSON header cut by SNIFF_SIZE can end with: part of a number or literal.
+_JSON_TAIL = re.compile(r"[-+.eE\d]*|t(r(ue?)?)?|f(a(l(se?)?)?)?|n(u(ll?)?)?")
+
+
+def _is_json_prefix(text: str) -> bool:
+    """Whether `text` is a JSON document or JSON lines, or the start of them."""
+    decoder = json.JSONDecoder()
+    pos = 0
+    while True:
+        try:
+            _, end = decoder.raw_decode(text, pos)
+        except json.JSONDecodeError as e:
+            return e.msg.startswith("Unterminated string") or bool(
+                _JSON_TAIL.fullmatch(text[e.pos :])
+            )
+        pos = len(text) - len(text[end:].lstrip())
+        if pos == len(text):
+            return True
+        if "\n" not in text[end:pos] or text[pos] not in "{[":
+            return False
+
+
+def _sniff_text(header: bytes) -> Optional[FileExt]:
+    """Html and json headers, other text is left to libmagic (xml, markdown, ini...)."""
+    if not header or b"\x00" in header:
+        return None
+    try:
+        text = codecs.getincrementaldecoder("utf-8")().decode(header, final=False)
+    except UnicodeDecodeError:
+        return None
+    text = text.lstrip("\ufeff \t\r\n")
+    lower = text[:16].lower()
+    if lower.startswith("<!doctype html") or lower.startswith("<html"):
+        return "html"
+    if text[:1] in ("{", "[") and _is_json_prefix(text.rstrip()):
+        return "json"
+    return None
+
+
+def _sniff(
+    header: bytes,
+    read_at: Callable[[int, int], bytes],
+    open_zip: Callable[[], zipfile.ZipFile],
+) -> Optional[FileExt]:
+    for signature, ext in FILE_SIGNATURES:
+        if header.startswith(signature):
+            if ext == "zip":
+                return _sniff_zip(open_zip)
+            if ext == "doc":
+                return _sniff_ole(header, read_at)
+            return ext
+    if b"%PDF-" in header[:1024]:
+        return "pdf"
+    return _sniff_text(header)
+
+
 def guess_file_extension(content: bytes) -> Optional[FileExt]:
-    mime = magic.from_buffer(content, mime=True).lower()
-    ext = guess_extension_from_mime(mime)
+    view = memoryview(content)
+    ext = _sniff(
+        bytes(view[:SNIFF_SIZE]),
+        lambda offset, size: bytes(view[offset : offset + size]),
+        lambda: zipfile.ZipFile(io.BytesIO(content)),
+    )
+    if ext is None:
+        mime = _get_magic().from_buffer(bytes(view[:MAGIC_BYTES_MAX])).lower()
+        ext = guess_extension_from_mime(mime)
+    return ext
+
+
+def guess_path_extension(path: str | Path) -> Optional[FileExt]:
+    """Like `guess_file_extension`, reading only the header of the file at `path`."""
+    with open(path, "rb") as f:
+
+        def _read_at(offset: int, size: int) -> bytes:
+            f.seek(offset)
+            return f.read(size)
+
+        ext = _sniff(f.read(SNIFF_SIZE), _read_at, lambda: zipfile.ZipFile(f))
+    if ext is None:
+        mime = _get_magic().from_file(str(path)).lower()
+        ext = guess_extension_from_mime(mime)
     return ext
+
+
+def guess_path_extensions(
+    paths: Iterable[str | Path],
+    max_workers: Optional[int] = None,
+) -> List[Optional[FileExt]]:
+    """`guess_path_extension` of many paths on a thread pool, in input order."""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(guess_path_extension, paths))
@@ -1,14 +1,41 @@
+import atexit
+import glob
+import gzip
+import json
 import logging
+import math
+import os
+import queue
+import shutil
 import sys
+import threading
 import time
-from logging.handlers import RotatingFileHandler
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
-from typing import Any, Dict, Literal, Optional, Sequence
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
-import colorlog
 from pydantic import BaseModel
-from pythonjsonlogger import jsonlogger
-from rich.logging import RichHandler
+
+from util_common.datetime import format_now
+
+if TYPE_CHECKING:
+    import multiprocessing
+
+# colorlog, rich, pythonjsonlogger and orjson are imported where used,
+# keeping `import util_common.logger` cheap for short-lived processes.
 
 _LogLevel = Literal[
     "debug",
@@ -35,7 +62,25 @@ LOG_FORMAT = (
     "%(log_color)s%(message)s%(reset)s"
 )
 
+_FileHandler = Literal[
+    "rotating",
+    "buffered",
+]
+
+_QueueOverflow = Literal[
+    "block",
+    "drop_oldest",
+    "drop_newest",
+]
+
 DEFAULT_LEVEL: _LogLevel = "info"
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_MAX_BYTES = 1048576
+DEFAULT_BACKUP_COUNT = 8
+DEFAULT_BUFFER_SIZE = 65536
+DEFAULT_FLOOD_RATE = 10.0
+DEFAULT_FLOOD_BURST = 20
+DEFAULT_RING_BUFFER_SIZE = 1000
 
 
 class LogSettings(BaseModel):
@@ -44,22 +89,508 @@ class LogSettings(BaseModel):
     save_file_or_dir: Optional[Path] = None
     rich_handler: bool = False  # rich stream print
     json_logger: bool = False  # save log file as .jsonl
+    file_handler: _FileHandler = "rotating"  # "buffered" batches writes and gzips backups
+    file_max_bytes: int = DEFAULT_MAX_BYTES  # 0 disables size rotation
+    file_backup_count: int = DEFAULT_BACKUP_COUNT
+    file_rotate_interval: float = 0  # seconds, 0 disables time rotation ("buffered" only)
+    file_buffer_size: int = DEFAULT_BUFFER_SIZE  # bytes ("buffered" only)
+    file_flush_interval: float = 1.0  # seconds ("buffered" only)
+    file_compress: bool = True  # gzip rotated files ("buffered" only)
+    queue_handler: bool = False  # emit from a background listener thread
+    queue_size: int = DEFAULT_QUEUE_SIZE  # 0 means unbounded
+    queue_overflow: _QueueOverflow = "block"  # policy when the queue is full
+    flood_control: bool = False  # rate limit and collapse repeats per callsite
+    flood_rate: float = DEFAULT_FLOOD_RATE  # records per second per callsite
+    flood_burst: int = DEFAULT_FLOOD_BURST
+    flood_window: float = 1.0  # seconds identical records are collapsed for
+    ring_buffer: bool = False  # keep records below `level` in memory, dump them on error
+    ring_buffer_size: int = DEFAULT_RING_BUFFER_SIZE
+    ring_buffer_level: _LogLevel = "debug"  # lowest level kept in the ring
+    ring_buffer_flush_level: _LogLevel = "error"  # level dumping the ring
+
+
+def _create_custom_json_formatter_class() -> type:
+    from pythonjsonlogger import jsonlogger
+
+    class CustomJsonFormatter(jsonlogger.JsonFormatter):
+        def add_fields(
+            self,
+            log_record: Dict[str, Any],
+            record: logging.LogRecord,
+            message_dict: Dict[str, Any],
+        ) -> None:
+            super().add_fields(log_record, record, message_dict)
+            unwanted_keys = set(log_record.keys()) - set(LOG_KEYS)
+            for k in unwanted_keys:
+                del log_record[k]
+
+    return CustomJsonFormatter
+
+
+def __getattr__(name: str) -> Any:
+    # CustomJsonFormatter subclasses pythonjsonlogger, create it on first access.
+    if name == "CustomJsonFormatter":
+        globals()[name] = _create_custom_json_formatter_class()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _get_json_dumps() -> Callable[[Dict[str, Any]], str]:
+    try:
+        import orjson
+    except ImportError:
+        return json.JSONEncoder(ensure_ascii=False, default=str).encode
+    return lambda obj: orjson.dumps(obj, default=str).decode("utf-8")
+
+
+class FastJsonFormatter(logging.Formatter):
+    """
+    JSON formatter reading only `fields` straight from the LogRecord.
+
+    The formatted timestamp is cached per second,
+    orjson is used for encoding when installed.
+    """
+
+    def __init__(
+        self,
+        fields: Sequence[str] = LOG_KEYS,
+        datefmt: Optional[str] = None,
+    ) -> None:
+        super().__init__(datefmt=datefmt)
+        self._getters: Tuple[Tuple[str, Callable[[logging.LogRecord], Any]], ...] = tuple(
+            (field, self._get_getter(field)) for field in fields
+        )
+        self._dumps = _get_json_dumps()
+        self._time_cache: Tuple[int, Optional[str], str] = (-1, None, "")
+
+    def _get_getter(self, field: str) -> Callable[[logging.LogRecord], Any]:
+        if field == "asctime":
+            return lambda record: self.formatTime(record, self.datefmt)
+        if field == "message":
+            return logging.LogRecord.getMessage
+        return lambda record: getattr(record, field, None)
+
+    def formatTime(self, record: logging.LogRecord, datefmt: Optional[str] = None) -> str:
+        second = int(record.created)
+        cached_second, cached_datefmt, cached_time = self._time_cache
+        if second != cached_second or datefmt != cached_datefmt:
+            cached_time = time.strftime(
+                datefmt or self.default_time_format, self.converter(record.created)
+            )
+            self._time_cache = (second, datefmt, cached_time)
+        if datefmt or not self.default_msec_format:
+            return cached_time
+        return self.default_msec_format % (cached_time, record.msecs)
+
+    def format(self, record: logging.LogRecord) -> str:
+        log_record = {field: getter(record) for field, getter in self._getters}
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            log_record["exc_info"] = record.exc_text
+        if record.stack_info:
+            log_record["stack_info"] = self.formatStack(record.stack_info)
+        return self._dumps(log_record)
+
+
+class BufferedRotatingFileHandler(logging.Handler):
+    """
+    File handler writing through an in-memory buffer.
+
+    The buffer is written out once it holds `buffer_size` bytes
+    or `flush_interval` seconds after the last write.
+    The file is rotated when it would exceed `max_bytes`
+    or every `rotate_interval` seconds (0 disables either),
+    rotated files get a timestamp in their name and are gzipped
+    and pruned to `backup_count` on a background thread.
+    """
+
+    terminator = "\n"
+
+    def __init__(
+        self,
+        filename: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        rotate_interval: float = 0,
+        backup_count: int = DEFAULT_BACKUP_COUNT,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        flush_interval: float = 1.0,
+        compress: bool = True,
+        encoding: str = "utf-8",
+    ) -> None:
+        super().__init__()
+        self.filename = os.path.abspath(filename)
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.compress = compress
+        self.encoding = encoding
+
+        self._buffer: List[bytes] = []
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+        self._stream = open(self.filename, "ab", buffering=0)
+        self._size = self._stream.tell()
+        self._rollover_at = self._next_rollover_at()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-rotate")
+        self._stop_flusher = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        if flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+            self._flusher.start()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            data = (self.format(record) + self.terminator).encode(self.encoding)
+            if self._should_rollover(len(data)):
+                self._rollover()
+            self._buffer.append(data)
+            self._buffered += len(data)
+            self._size += len(data)
+            if (
+                self._buffered >= self.buffer_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            ):
+                self._write_buffer()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self) -> None:
+        with self.lock:  # type: ignore
+            self._write_buffer()
+
+    def close(self) -> None:
+        self._stop_flusher.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        with self.lock:  # type: ignore
+            if not self._stream.closed:
+                self._write_buffer()
+                self._stream.close()
+        self._executor.shutdown(wait=True)
+        super().close()
+
+    def _write_buffer(self) -> None:
+        if self._buffer and not self._stream.closed:
+            self._stream.write(b"".join(self._buffer))
+            self._buffer.clear()
+            self._buffered = 0
+        self._last_flush = time.monotonic()
+
+    def _flush_periodically(self) -> None:
+        while not self._stop_flusher.wait(self.flush_interval):
+            self.flush()
+
+    def _next_rollover_at(self) -> float:
+        if self.rotate_interval > 0:
+            return time.time() + self.rotate_interval
+        return math.inf
+
+    def _should_rollover(self, n_bytes: int) -> bool:
+        if self.max_bytes > 0 and self._size > 0 and self._size + n_bytes > self.max_bytes:
+            return True
+        return time.time() >= self._rollover_at
+
+    def _rollover(self) -> None:
+        self._write_buffer()
+        self._stream.close()
+        stem, suffix = os.path.splitext(self.filename)
+        rotated = f"{stem}.{format_now('%Y%m%d_%H%M%S_%f')}{suffix}"
+        os.rename(self.filename, rotated)
+        self._stream = open(self.filename, "ab", buffering=0)
+        self._size = 0
+        self._rollover_at = self._next_rollover_at()
+        self._executor.submit(self._process_rotated, rotated)
+
+    def _process_rotated(self, rotated: str) -> None:
+        if self.compress is True:
+            with open(rotated, "rb") as src, gzip.open(f"{rotated}.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+        stem, suffix = os.path.splitext(self.filename)
+        pattern = f"{glob.escape(stem)}.{'[0-9]' * 8}_*Z{glob.escape(suffix)}*"
+        backups = sorted(glob.glob(pattern))
+        for backup in backups[: max(len(backups) - self.backup_count, 0)]:
+            os.remove(backup)
+
+
+class _CallsiteState:
+    __slots__ = ("tokens", "updated", "msg", "args", "since", "repeated", "limited", "last")
+
+    def __init__(self, tokens: float, now: float) -> None:
+        self.tokens = tokens
+        self.updated = now
+        self.msg: Any = None
+        self.args: Any = None
+        self.since = -math.inf
+        self.repeated = 0
+        self.limited = 0
+        self.last: Optional[logging.LogRecord] = None
+
+
+class FloodControlFilter(logging.Filter):
+    """
+    Per-callsite flood control.
+
+    Records are keyed by (logger name, filename, lineno, level).
+    A record identical to the last one passed from its callsite
+    within `window` seconds is collapsed, other records go through
+    a token bucket refilled at `rate` per second up to `burst`.
+    The suppressed count is emitted as a single "repeated N times" record
+    before the next record passed from the callsite, or once `window` has
+    passed since, checked on the next record from any callsite and by a timer.
+    `flush` emits the pending counts, it is called by `shutdown_loggers`.
+    """
+
+    def __init__(
+        self,
+        rate: float = DEFAULT_FLOOD_RATE,
+        burst: int = DEFAULT_FLOOD_BURST,
+        window: float = 1.0,
+    ) -> None:
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.window = window
+        self._states: Dict[Tuple[str, str, int, int], _CallsiteState] = {}
+        self._lock = threading.Lock()
+        self._next_sweep = -math.inf
+        self._timer: Optional[threading.Timer] = None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "flood_summary", False):
+            return True
+        # Shared by several handlers, a record is only counted by the first one.
+        decided = getattr(record, "flood_passed", None)
+        if decided is not None:
+            return decided
+        passed = self._filter(record)
+        setattr(record, "flood_passed", passed)
+        return passed
+
+    def _filter(self, record: logging.LogRecord) -> bool:
+        now = record.created
+        key = (record.name, record.filename, record.lineno, record.levelno)
+        with self._lock:
+            summaries = []
+            if now >= self._next_sweep:
+                summaries = self._pop_summaries(now)
+                self._next_sweep = now + self.window
+            passed = self._update(key, record, now)
+            if passed:
+                summaries.extend(self._pop_summaries(now, key))
+            else:
+                self._schedule_flush()
+        self._emit(summaries)
+        return passed
+
+    def _update(
+        self, key: Tuple[str, str, int, int], record: logging.LogRecord, now: float
+    ) -> bool:
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = _CallsiteState(self.burst, now)
+        if now - state.since < self.window and self._is_repeated(state, record):
+            state.repeated += 1
+            state.last = record
+            return False
+        state.tokens = min(self.burst, state.tokens + (now - state.updated) * self.rate)
+        state.updated = now
+        if state.tokens < 1:
+            state.limited += 1
+            state.last = record
+            return False
+        state.tokens -= 1
+        state.msg, state.args, state.since = record.msg, record.args, now
+        return True
+
+    def _pop_summaries(
+        self, now: float, key: Optional[Tuple[str, str, int, int]] = None
+    ) -> List[logging.LogRecord]:
+        """Summaries of `key`, or of the callsites whose window has passed at `now`."""
+        if key is not None:
+            states = [self._states[key]]
+        else:
+            states = [x for x in self._states.values() if now - x.since >= self.window]
+        summaries = [self._pop_summary(x) for x in states]
+        return [x for x in summaries if x is not None]
+
+    def _schedule_flush(self) -> None:
+        if self._timer is None:
+            self._timer = threading.Timer(self.window, self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _on_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+            summaries = self._pop_summaries(time.time())
+            if any(x.last is not None for x in self._states.values()):
+                self._schedule_flush()
+        self._emit(summaries)
 
+    def flush(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            summaries = self._pop_summaries(math.inf)
+        self._emit(summaries)
 
-class CustomJsonFormatter(jsonlogger.JsonFormatter):
-    def add_fields(
+    @staticmethod
+    def _emit(summaries: List[logging.LogRecord]) -> None:
+        for summary in summaries:
+            logging.getLogger(summary.name).handle(summary)
+
+    @staticmethod
+    def _is_repeated(state: _CallsiteState, record: logging.LogRecord) -> bool:
+        try:
+            return bool(record.msg == state.msg and record.args == state.args)
+        except Exception:
+            return False
+
+    @staticmethod
+    def _pop_summary(state: _CallsiteState) -> Optional[logging.LogRecord]:
+        if state.last is None:
+            return None
+        suppressed = state.repeated + state.limited
+        if state.limited == 0:
+            suffix = f"(repeated {suppressed} times)"
+        else:
+            suffix = f"(repeated {suppressed} times, {state.limited} rate limited)"
+        summary = logging.makeLogRecord(
+            {
+                **state.last.__dict__,
+                "msg": f"{state.last.getMessage()} {suffix}",
+                "args": None,
+                "flood_summary": True,
+            }
+        )
+        state.repeated = state.limited = 0
+        state.last = None
+        return summary
+
+
+class RingBufferHandler(logging.Handler):
+    """
+    Keep the last `capacity` records below `threshold` unformatted in memory.
+
+    When a record at `flush_level` or above arrives,
+    or `dump` is called, the kept records are handled by `targets`
+    regardless of their level and the ring is cleared.
+    Records are kept as they are, so their args are formatted at dump time.
+    """
+
+    def __init__(
         self,
-        log_record: Dict[str, Any],
-        record: logging.LogRecord,
-        message_dict: Dict[str, Any],
+        targets: Sequence[logging.Handler],
+        capacity: int = DEFAULT_RING_BUFFER_SIZE,
+        threshold: int = logging.INFO,
+        flush_level: int = logging.ERROR,
     ) -> None:
-        super().add_fields(log_record, record, message_dict)
-        unwanted_keys = set(log_record.keys()) - set(LOG_KEYS)
-        for k in unwanted_keys:
-            del log_record[k]
+        super().__init__()
+        self.targets = list(targets)
+        self.threshold = threshold
+        self.flush_level = flush_level
+        self.buffer: Deque[logging.LogRecord] = deque(maxlen=capacity)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.levelno < self.threshold:
+            self.buffer.append(record)
+        elif record.levelno >= self.flush_level:
+            self.dump()
+
+    def dump(self) -> None:
+        with self.lock:  # type: ignore
+            records = list(self.buffer)
+            self.buffer.clear()
+        for record in records:
+            for target in self.targets:
+                target.handle(record)
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    QueueHandler with an overflow policy for bounded queues.
+
+    block: wait until the listener frees a slot.
+    drop_oldest: discard the oldest queued record to make room.
+    drop_newest: discard the incoming record.
+    Discarded records are counted in `dropped`.
+    """
+
+    def __init__(self, queue_: queue.Queue, overflow: _QueueOverflow = "block") -> None:
+        super().__init__(queue_)
+        self._queue = queue_
+        self.overflow = overflow
+        self.dropped = 0
+        self._drop_lock = threading.Lock()
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.overflow == "block":
+            self._queue.put(record)
+            return
+        try:
+            self._queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if self.overflow == "drop_oldest":
+            try:
+                oldest = self._queue.get_nowait()
+                self._queue.task_done()
+            except queue.Empty:
+                pass
+            else:
+                if not isinstance(oldest, logging.LogRecord):
+                    # The listener's stop sentinel, put it back and drop the record instead.
+                    self._queue.put(oldest)
+                    self._count_drop()
+                    return
+                self._count_drop()
+            try:
+                self._queue.put_nowait(record)
+                return
+            except queue.Full:
+                pass
+        self._count_drop()
+
+    def _count_drop(self) -> None:
+        with self._drop_lock:
+            self.dropped += 1
+
+
+class _BlockingQueueListener(QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # The queue may be full, wait for the listener to make room
+        # so every record queued before stop() is flushed.
+        while True:
+            try:
+                super().enqueue_sentinel()
+                return
+            except queue.Full:
+                time.sleep(0.001)
+
+
+class _AggregatorListener(QueueListener):
+    def handle(self, record: logging.LogRecord) -> None:
+        # Route worker records through this process' own logger configuration.
+        logger = logging.getLogger(record.name)
+        if logger.isEnabledFor(record.levelno):
+            logger.handle(record)
+
+
+_listeners: Dict[Optional[str], QueueListener] = {}
+_listeners_lock = threading.Lock()
+_aggregator: Optional[QueueListener] = None
 
 
 def get_stream_handler() -> logging.StreamHandler:
+    import colorlog
+
     formatter = colorlog.ColoredFormatter(LOG_FORMAT)
     stream_handler = logging.StreamHandler(sys.stderr)
     stream_handler.setFormatter(formatter)
@@ -83,6 +614,69 @@ def configure_logger(log_settings: Optional[LogSettings]) -> None:
     _configure_logger(log_settings)
 
 
+def setup_log_aggregator(
+    log_settings_list: Sequence[Optional[LogSettings]],
+) -> "multiprocessing.Queue":
+    """
+    Make this process the single writer of the logs of its worker processes.
+
+    Loggers are configured here as by `setup_loggers`,
+    records sent by workers set up with `setup_worker_loggers`
+    on the returned queue are handled by them on a listener thread.
+    """
+    import multiprocessing
+
+    global _aggregator
+    setup_loggers(log_settings_list)
+    _stop_aggregator()
+    queue_: "multiprocessing.Queue" = multiprocessing.Queue()
+    listener = _AggregatorListener(queue_)
+    with _listeners_lock:
+        _aggregator = listener
+    listener.start()
+    return queue_
+
+
+def setup_worker_loggers(
+    queue_: "multiprocessing.Queue",
+    log_settings_list: Sequence[Optional[LogSettings]],
+) -> None:
+    """
+    Send the records of the loggers in `log_settings_list` to the
+    queue returned by `setup_log_aggregator` instead of handling them here.
+
+    Meant as a process pool initializer:
+    `ProcessPoolExecutor(initializer=setup_worker_loggers, initargs=(queue_, settings))`
+    Only `name` and `level` of the settings are used.
+    """
+    for log_settings in log_settings_list:
+        if log_settings is None:
+            log_settings = LogSettings()
+        # Handlers inherited from a forked parent belong to the writer,
+        # drop them without closing so buffered parent data is not written twice.
+        with _listeners_lock:
+            _listeners.pop(log_settings.name, None)
+        logger = logging.getLogger(log_settings.name)
+        logger.setLevel(getattr(logging, log_settings.level.upper()))
+        logger.handlers.clear()
+        logger.propagate = False
+        logger.addHandler(QueueHandler(queue_))
+
+
+def shutdown_loggers() -> None:
+    """Stop all queue listeners, flushing the records still queued and the flood counts."""
+    loggers = [logging.getLogger(), *logging.Logger.manager.loggerDict.values()]
+    for logger in loggers:
+        if isinstance(logger, logging.Logger):
+            for filter_ in _flood_filters(logger):
+                filter_.flush()
+    _stop_aggregator()
+    with _listeners_lock:
+        names = list(_listeners.keys())
+    for name in names:
+        _stop_listener(name)
+
+
 def setup_basic_log_config() -> None:
     logging.basicConfig(datefmt="%Y-%m-%d %H:%M:%S")
     logging.Formatter.converter = time.gmtime
@@ -92,9 +686,13 @@ def _configure_logger(
     log_settings: LogSettings,
 ) -> None:
     logger = _init_logger(log_settings.name, log_settings.level)
+    _stop_listener(log_settings.name)
+    handlers: List[logging.Handler] = []
 
     if log_settings.rich_handler is True:
-        logger.addHandler(
+        from rich.logging import RichHandler
+
+        handlers.append(
             RichHandler(
                 rich_tracebacks=True,
                 show_time=True,
@@ -105,23 +703,110 @@ def _configure_logger(
             )
         )
     else:
-        logger.addHandler(get_stream_handler())
+        handlers.append(get_stream_handler())
 
     if log_settings.save_file_or_dir is not None:
         log_file = _create_log_file(
             log_settings.save_file_or_dir,
             log_settings.name,
         )
-        file_handler = RotatingFileHandler(
-            filename=str(log_file),
-            maxBytes=1048576,
-            backupCount=8,
-        )
+        file_handler: logging.Handler
+        if log_settings.file_handler == "buffered":
+            file_handler = BufferedRotatingFileHandler(
+                filename=str(log_file),
+                max_bytes=log_settings.file_max_bytes,
+                rotate_interval=log_settings.file_rotate_interval,
+                backup_count=log_settings.file_backup_count,
+                buffer_size=log_settings.file_buffer_size,
+                flush_interval=log_settings.file_flush_interval,
+                compress=log_settings.file_compress,
+            )
+        else:
+            file_handler = RotatingFileHandler(
+                filename=str(log_file),
+                maxBytes=log_settings.file_max_bytes,
+                backupCount=log_settings.file_backup_count,
+            )
         if log_settings.json_logger is True:
-            file_handler.setFormatter(CustomJsonFormatter(LOG_FORMAT))
+            file_handler.setFormatter(FastJsonFormatter())
         else:
+            import colorlog
+
             file_handler.setFormatter(colorlog.ColoredFormatter(LOG_FORMAT))
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
+
+    if log_settings.ring_buffer is True:
+        level = getattr(logging, log_settings.level.upper())
+        for handler in handlers:
+            handler.setLevel(level)
+        # Goes first so the context is dumped before the record triggering it.
+        handlers.insert(
+            0,
+            RingBufferHandler(
+                handlers.copy(),
+                capacity=log_settings.ring_buffer_size,
+                threshold=level,
+                flush_level=getattr(logging, log_settings.ring_buffer_flush_level.upper()),
+            ),
+        )
+        logger.setLevel(min(level, getattr(logging, log_settings.ring_buffer_level.upper())))
+
+    if log_settings.queue_handler is True:
+        _start_listener(logger, handlers, log_settings)
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
+
+    if log_settings.flood_control is True:
+        # On the handlers, logger filters do not see the records of child loggers.
+        flood_filter = FloodControlFilter(
+            rate=log_settings.flood_rate,
+            burst=log_settings.flood_burst,
+            window=log_settings.flood_window,
+        )
+        for handler in logger.handlers:
+            handler.addFilter(flood_filter)
+
+
+def _start_listener(
+    logger: logging.Logger,
+    handlers: List[logging.Handler],
+    log_settings: LogSettings,
+) -> None:
+    queue_: queue.Queue = queue.Queue(maxsize=max(log_settings.queue_size, 0))
+    logger.addHandler(BoundedQueueHandler(queue_, log_settings.queue_overflow))
+    listener = _BlockingQueueListener(queue_, *handlers, respect_handler_level=True)
+    with _listeners_lock:
+        _listeners[log_settings.name] = listener
+    listener.start()
+
+
+def _stop_listener(name: Optional[str]) -> None:
+    with _listeners_lock:
+        listener = _listeners.pop(name, None)
+    if listener is None:
+        return
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+def _stop_aggregator() -> None:
+    global _aggregator
+    with _listeners_lock:
+        listener, _aggregator = _aggregator, None
+    if listener is not None:
+        listener.stop()
+
+
+def _flood_filters(logger: logging.Logger) -> List[FloodControlFilter]:
+    """The flood filters of `logger` and its handlers, once each."""
+    filters: Dict[int, FloodControlFilter] = {}
+    for filterer in [logger, *logger.handlers]:
+        for filter_ in filterer.filters:
+            if isinstance(filter_, FloodControlFilter):
+                filters[id(filter_)] = filter_
+    return list(filters.values())
 
 
 def _init_logger(
@@ -130,6 +815,11 @@ def _init_logger(
 ) -> logging.Logger:
     logger = logging.getLogger(name)
     logger.setLevel(getattr(logging, level.upper()))
+    for filter_ in _flood_filters(logger):
+        filter_.flush()
+        logger.removeFilter(filter_)
+    for handler in logger.handlers:
+        handler.close()
     logger.handlers.clear()
     logger.propagate = False
     return logger
@@ -153,3 +843,6 @@ def _create_log_file(log_path: Path, name: Optional[str] = None) -> Path:
         log_path = log_path.joinpath(f"{name}.log")
 
     return log_path
+
+
+atexit.register(shutdown_loggers)
@@ -1,10 +1,38 @@
+import errno
+import fnmatch
+import hashlib
+import heapq
 import os
+import pickle
 import posixpath
+import queue
 import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Callable, Dict, Iterable, List, Literal, Optional, Tuple, Union, get_args
-
-import natsort
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+    get_args,
+    overload,
+)
 
 from util_common._log import log
 
@@ -53,9 +81,17 @@ DOCUMENT_EXTS: List[DocumentExt] = TEXT_EXTS + IMAGE_EXTS + PDF_EXTS + OFFICE_EX
 FileExt = Union[ArchiveExt, TextExt, ImageExt, PdfExt, OfficeExt]
 FILE_EXTS: List[FileExt] = ARCHIVE_EXTS + TEXT_EXTS + IMAGE_EXTS + PDF_EXTS + OFFICE_EXTS
 
+SORT_MAX_IN_MEMORY = 1_000_000
+SORT_RUN_BATCH_SIZE = 10_000
+
+# Hidden folder, next to the removed ones, emptied by background threads.
+TRASH_NAME = ".util_common_trash"
+TRASH_WORKERS = 8
+
 IGNORE_NAMES = [
     "__MACOSX",
     ".DS_Store",
+    TRASH_NAME,
 ]
 MIME_TYPES: Dict[str, str] = {
     "jpg": "image/jpeg",
@@ -123,14 +159,86 @@ def get_absolute_cwd_path() -> Path:
     return Path(os.path.abspath(os.getcwd()))
 
 
+def _write_sort_run(records: List[Tuple[Any, str]], folder: str) -> str:
+    fd, path = tempfile.mkstemp(suffix=".run", dir=folder)
+    with os.fdopen(fd, "wb") as f:
+        for i in range(0, len(records), SORT_RUN_BATCH_SIZE):
+            pickle.dump(records[i : i + SORT_RUN_BATCH_SIZE], f, pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def _read_sort_run(path: str) -> Iterator[Tuple[Any, str]]:
+    with open(path, "rb") as f:
+        while True:
+            try:
+                batch = pickle.load(f)
+            except EOFError:
+                return
+            yield from batch
+
+
+@overload
+def iter_sorted_paths(
+    path_iter: Iterable[str | Path],
+    as_str: Literal[False] = False,
+    max_in_memory: int = SORT_MAX_IN_MEMORY,
+    tmp_dir: Optional[str | Path] = None,
+) -> Generator[Path, None, None]:
+    pass
+
+
+@overload
+def iter_sorted_paths(
+    path_iter: Iterable[str | Path],
+    as_str: Literal[True],
+    max_in_memory: int = SORT_MAX_IN_MEMORY,
+    tmp_dir: Optional[str | Path] = None,
+) -> Generator[str, None, None]:
+    pass
+
+
+def iter_sorted_paths(
+    path_iter: Iterable[str | Path],
+    as_str: bool = False,
+    max_in_memory: int = SORT_MAX_IN_MEMORY,
+    tmp_dir: Optional[str | Path] = None,
+) -> Generator[str | Path, None, None]:
+    """
+    Naturally sort `path_iter`, yielding `Path`s, or strings with `as_str`.
+
+    The natural key of each path is computed once. Above `max_in_memory`
+    paths, sorted runs are spilled to a temporary folder in `tmp_dir` and
+    merged lazily; the folder is removed once the iterator is exhausted or closed.
+    """
+    import natsort
+
+    natural_key = natsort.natsort_keygen()
+    records: List[Tuple[Any, str]] = []
+    runs: List[str] = []
+    folder = None
+    try:
+        for path in path_iter:
+            path = str(path)
+            records.append((natural_key(path), path))
+            if len(records) >= max_in_memory:
+                if folder is None:
+                    folder = tempfile.mkdtemp(prefix="sort-", dir=tmp_dir)
+                records.sort()
+                runs.append(_write_sort_run(records, folder))
+                records = []
+        records.sort()
+        merged: Iterable[Tuple[Any, str]] = records
+        if runs:
+            merged = heapq.merge(*[_read_sort_run(x) for x in runs], records)
+        for _, path in merged:
+            yield path if as_str else Path(path)
+    finally:
+        if folder is not None:
+            shutil.rmtree(folder, ignore_errors=True)
+
+
 def sort_paths(path_iter: Iterable[str | Path]) -> List[Path]:
-    return [
-        Path(x)
-        for x in natsort.natsorted(
-            list(path_iter),
-            key=lambda x: str(x),
-        )
-    ]
+    return list(iter_sorted_paths(path_iter))
 
 
 def ensure_parent(path: Path | str) -> None:
@@ -145,32 +253,171 @@ def ensure_folder(path: Path | str) -> None:
         raise FileExistsError()
 
 
-def move(src_path: Path | str, dst_path: Path | str) -> None:
+class CopyResult(NamedTuple):
+    copied: List[str]
+    skipped: List[str]
+    failed: List[Tuple[str, str]]
+    n_bytes: int
+    elapsed: float
+
+    @property
+    def bytes_per_sec(self) -> float:
+        return self.n_bytes / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def move(
+    src_path: Path | str, dst_path: Path | str, parallel: bool = False, max_workers: int = 8
+) -> Optional[CopyResult]:
+    """
+    Move `src_path` to `dst_path`.
+
+    With `parallel`, a folder on another filesystem is copied with `copy_tree`,
+    removed only when every entry was copied, and the `CopyResult` is returned.
+    As with `shutil.move`, a folder moved to an existing folder goes inside it.
+    """
     ensure_parent(dst_path)
+    if parallel and Path(src_path).is_dir() and not Path(src_path).is_symlink():
+        if os.path.isdir(dst_path):
+            dst_path = os.path.join(dst_path, Path(src_path).name)
+            if os.path.lexists(dst_path):
+                raise shutil.Error(f"Destination path '{dst_path}' already exists")
+        try:
+            os.rename(src_path, dst_path)
+            return None
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+        result = copy_tree(src_path, dst_path, max_workers=max_workers, skip_identical=False)
+        if not result.failed:
+            shutil.rmtree(src_path)
+        return result
     try:
         shutil.move(src_path, dst_path)
     except Exception as e:
         log.warning(f"move failed: {e}")
+    return None
 
 
-def duplicate(src_path: Path | str, dst_path: Path | str) -> None:
+def duplicate(
+    src_path: Path | str, dst_path: Path | str, parallel: bool = False, max_workers: int = 8
+) -> Optional[CopyResult]:
+    """
+    Copy a file or folder from `src_path` to `dst_path`.
+
+    With `parallel`, a folder is copied with `copy_tree` and its `CopyResult` is returned.
+    """
     ensure_parent(dst_path)
     if Path(src_path).is_file():
         shutil.copyfile(src_path, dst_path)
     elif Path(src_path).is_dir():
+        if parallel:
+            return copy_tree(src_path, dst_path, max_workers=max_workers)
         shutil.copytree(src_path, dst_path, dirs_exist_ok=True)
     else:
         raise FileNotFoundError(f"{src_path}: Not exists!")
+    return None
+
+
+_trash_queue: Optional["queue.Queue[Tuple[str, str]]"] = None
+_trash_roots: Set[str] = set()
+_trash_lock = threading.Lock()
 
 
-def remove_folder(path: Path | str, trash_dir: Optional[Path | str] = None) -> None:
+def _delete_trashed(trash_root: str, path: str, jobs: "queue.Queue[Tuple[str, str]]") -> None:
+    # Sub folders are renamed into the trash and queued, so they are emptied in parallel.
+    if os.path.islink(path) or not os.path.isdir(path):
+        os.remove(path)
+        return
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                moved = os.path.join(trash_root, uuid.uuid4().hex)
+                os.rename(entry.path, moved)
+                jobs.put((trash_root, moved))
+            else:
+                os.remove(entry.path)
+    os.rmdir(path)
+
+
+def _trash_worker(jobs: "queue.Queue[Tuple[str, str]]") -> None:
+    while True:
+        trash_root, path = jobs.get()
+        try:
+            _delete_trashed(trash_root, path, jobs)
+        except FileNotFoundError:
+            pass  # already deleted, by another worker or process
+        except OSError as e:
+            log.warning(f"background removal of {path} failed: {e}")
+        finally:
+            jobs.task_done()
+
+
+def _get_trash_queue() -> "queue.Queue[Tuple[str, str]]":
+    global _trash_queue
+    with _trash_lock:
+        if _trash_queue is None:
+            _trash_queue = queue.Queue()
+            for _ in range(TRASH_WORKERS):
+                threading.Thread(target=_trash_worker, args=(_trash_queue,), daemon=True).start()
+        return _trash_queue
+
+
+def empty_trash(folder: Path | str) -> None:
+    """Queue the background removal of what is left in the trash of `folder`."""
+    trash_root = os.path.join(folder, TRASH_NAME)
+    with _trash_lock:
+        _trash_roots.add(trash_root)
+    try:
+        names = os.listdir(trash_root)
+    except FileNotFoundError:
+        return
+    jobs = _get_trash_queue()
+    for name in names:
+        jobs.put((trash_root, os.path.join(trash_root, name)))
+
+
+def wait_for_trash() -> None:
+    """Block until the background removals are done."""
+    if _trash_queue is not None:
+        _trash_queue.join()
+
+
+def _move_to_trash(path: Path) -> bool:
+    trash_root = str(path.parent.joinpath(TRASH_NAME))
+    trashed = os.path.join(trash_root, f"{path.name}-{uuid.uuid4().hex}")
+    try:
+        os.makedirs(trash_root, exist_ok=True)
+        os.rename(path, trashed)
+    except OSError as e:
+        log.warning(f"{path} can not be moved to trash: {e}")
+        return False
+    with _trash_lock:
+        leftovers = trash_root not in _trash_roots
+    if leftovers:
+        # Trash left by a previous run, interrupted before it was emptied.
+        empty_trash(path.parent)
+    else:
+        _get_trash_queue().put((trash_root, trashed))
+    return True
+
+
+def remove_folder(
+    path: Path | str, trash_dir: Optional[Path | str] = None, background: bool = False
+) -> None:
+    """
+    Remove the folder at `path`, or move it to `trash_dir` if given.
+
+    With `background`, the folder is renamed into a hidden trash next to it
+    and deleted by background threads, so the call returns immediately.
+    Trash left by an interrupted run is removed the next time it is used.
+    """
     path = Path(path)
     if path.exists():
         if path.is_dir():
-            if trash_dir is None:
-                shutil.rmtree(path)
-            else:
+            if trash_dir is not None:
                 move(path, Path(trash_dir).joinpath(path.name))
+            elif not (background and _move_to_trash(path)):
+                shutil.rmtree(path)
         else:
             log.warning(f"{path} is a file!")
     else:
@@ -193,13 +440,19 @@ def remove_file(path: Path | str, trash_dir: Optional[Path | str] = None, exists
             log.warning(f"{path} not exists!")
 
 
-def clear_folder(path: Path | str) -> Path:
+def clear_folder(path: Path | str, background: bool = False) -> Path:
     path = Path(path)
-    remove_folder(path)
+    remove_folder(path, background=background)
     path.mkdir(parents=True, exist_ok=True)
     return path
 
 
+def hash_file(path: str | Path, algorithm: str = "sha256") -> str:
+    """Hex digest of the content of the file at `path`."""
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, algorithm).hexdigest()
+
+
 def get_parent(path: str | Path) -> str:
     return os.path.dirname(str(path))
 
@@ -255,18 +508,331 @@ def guess_extension_from_mime(mime: Optional[str]) -> Optional[FileExt]:
         if "pdf" in mime:
             return "pdf"
 
+        if "html" in mime:
+            return "html"
+
+        if "json" in mime:
+            return "json"
+
+        if mime == "text/plain":
+            return "txt"
+
     return None
 
 
 def recursive_list_named_children(
     folder: str | Path,
     filename: str,
+    parallel: bool = False,
 ) -> Iterable[Path]:
+    """
+    Paths under `folder` matching `filename` (a glob pattern).
+    With `parallel`, only files are listed, by `walk_files` in no particular order.
+    """
+    if parallel is True:
+        return (Path(x.path) for x in walk_files(folder, patterns=[filename], ignore_names=[]))
     paths = Path(folder).glob(f"**/{filename}")
     return paths
 
 
-def recursive_list_files(folder: str | Path) -> Iterable[Path]:
+def recursive_list_files(folder: str | Path, parallel: bool = False) -> Iterable[Path]:
+    """With `parallel`, files are listed by `walk_files` in no particular order."""
+    if parallel is True:
+        yield from (Path(x.path) for x in walk_files(folder))
+        return
     for root, _, files in os.walk(folder):
         for file_name in [x for x in files if x not in IGNORE_NAMES]:
             yield Path(os.path.join(root, file_name))
+
+
+class FileEntry(NamedTuple):
+    path: str
+    size: int
+    mtime: float
+    inode: int
+    dev: int  # with `inode`, identifies the file across filesystems
+    depth: int  # 0 for files directly in the walked folder
+
+
+class _DirScan(NamedTuple):
+    depth: int
+    files: List[FileEntry]
+    folders: List[str]
+    error: Optional[OSError]
+
+
+def _scan_dir(
+    folder: str,
+    depth: int,
+    match: Callable[[str], bool],
+    ignore_names: Sequence[str],
+) -> _DirScan:
+    files: List[FileEntry] = []
+    folders: List[str] = []
+    error = None
+    try:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.name in ignore_names:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    folders.append(entry.path)
+                    continue
+                if not match(entry.name) or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append(
+                    FileEntry(
+                        entry.path, stat.st_size, stat.st_mtime, stat.st_ino, stat.st_dev, depth
+                    )
+                )
+    except OSError as e:
+        error = e
+    return _DirScan(depth, files, folders, error)
+
+
+def walk_files(
+    folder: str | Path,
+    extensions: Optional[Iterable[str]] = None,
+    patterns: Optional[Iterable[str]] = None,
+    ignore_names: Sequence[str] = IGNORE_NAMES,
+    max_depth: Optional[int] = None,
+    max_workers: int = 8,
+    on_error: Optional[Callable[[OSError], None]] = None,
+) -> Iterator[FileEntry]:
+    """
+    Yield the files under `folder` with their stat info, reading folders in parallel.
+
+    Files are filtered by `extensions` (case-insensitive, without dot)
+    and by glob `patterns` on their name, files and folders named in
+    `ignore_names` are skipped, symlinked folders are not followed.
+    `max_depth` 0 lists only the files directly in `folder`.
+    At most 2 * `max_workers` folders are scanned ahead, in no particular order.
+    A folder that cannot be read is skipped, its error, with the folder as
+    `filename`, is passed to `on_error` or logged as a warning.
+    """
+    exts = None if extensions is None else {x.lower().lstrip(".") for x in extensions}
+    pattern_list = None if patterns is None else list(patterns)
+
+    def _match(name: str) -> bool:
+        if exts is not None and get_extension(name) not in exts:
+            return False
+        if pattern_list is not None and not any(fnmatch.fnmatch(name, x) for x in pattern_list):
+            return False
+        return True
+
+    folders: Deque[Tuple[str, int]] = deque([(str(folder), 0)])
+    scans: Deque[Future] = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            while folders or scans:
+                while folders and len(scans) < 2 * max_workers:
+                    sub_folder, depth = folders.pop()
+                    scans.append(
+                        executor.submit(_scan_dir, sub_folder, depth, _match, ignore_names)
+                    )
+                done, _ = wait(scans, return_when=FIRST_COMPLETED)
+                for scan in [x for x in scans if x in done]:
+                    scans.remove(scan)
+                    result: _DirScan = scan.result()
+                    if result.error is not None:
+                        if on_error is None:
+                            log.warning(f"scan failed: {result.error}")
+                        else:
+                            on_error(result.error)
+                    if max_depth is None or result.depth < max_depth:
+                        folders.extend((x, result.depth + 1) for x in result.folders)
+                    yield from result.files
+        finally:
+            for scan in scans:
+                scan.cancel()
+
+
+_FICLONE = 0x40049409
+_COPY_RANGE_SIZE = 1 << 30
+_COPY_BUFFER_SIZE = 1 << 20
+
+
+def _copy_file_range(src_fd: int, dst_fd: int, offset: int) -> int:
+    return os.copy_file_range(src_fd, dst_fd, _COPY_RANGE_SIZE, offset, offset)
+
+
+def _sendfile(src_fd: int, dst_fd: int, offset: int) -> int:
+    return os.sendfile(dst_fd, src_fd, offset, _COPY_RANGE_SIZE)
+
+
+def _copy_fd(src_fd: int, dst_fd: int, size: int) -> int:
+    try:
+        import fcntl
+
+        fcntl.ioctl(dst_fd, _FICLONE, src_fd)
+        return size
+    except (ImportError, OSError):
+        pass
+    for copy_range in [
+        _copy_file_range if hasattr(os, "copy_file_range") else None,
+        _sendfile if hasattr(os, "sendfile") else None,
+    ]:
+        if copy_range is None:
+            continue
+        offset = 0
+        try:
+            while n := copy_range(src_fd, dst_fd, offset):
+                offset += n
+        except OSError:
+            offset = -1
+        # Some filesystems stop early, fall back when the copy is short.
+        if offset == size:
+            return size
+        os.ftruncate(dst_fd, 0)
+        os.lseek(dst_fd, 0, os.SEEK_SET)
+    offset = 0
+    while data := os.pread(src_fd, _COPY_BUFFER_SIZE, offset):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(dst_fd, view) :]
+        offset += len(data)
+    return offset
+
+
+def copy_file(src_path: Path | str, dst_path: Path | str, preserve_metadata: bool = True) -> int:
+    """
+    Copy a file with a reflink, `copy_file_range` or `sendfile`, whichever the kernel supports.
+
+    Returns the number of bytes copied.
+    """
+    src_fd = os.open(src_path, os.O_RDONLY)
+    try:
+        size = os.fstat(src_fd).st_size
+        dst_fd = os.open(dst_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            n_bytes = _copy_fd(src_fd, dst_fd, size)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+    if preserve_metadata:
+        shutil.copystat(src_path, dst_path)
+    return n_bytes
+
+
+def _copy_symlink(src_path: str, dst_path: str) -> bool:
+    """Recreate the symlink at `dst_path`, False if the same one is already there."""
+    target = os.readlink(src_path)
+    if os.path.islink(dst_path) or os.path.isfile(dst_path):
+        if os.path.islink(dst_path) and os.readlink(dst_path) == target:
+            return False
+        os.remove(dst_path)
+    os.symlink(target, dst_path)
+    shutil.copystat(src_path, dst_path, follow_symlinks=False)
+    return True
+
+
+def _is_identical(entry: FileEntry, dst_path: str) -> bool:
+    try:
+        stat = os.stat(dst_path)
+    except OSError:
+        return False
+    return stat.st_size == entry.size and stat.st_mtime == entry.mtime
+
+
+def _walk_copy_tree(
+    src_folder: str,
+    dst_folder: str,
+    copied: List[str],
+    skipped: List[str],
+    failed: List[Tuple[str, str]],
+    folders: List[Tuple[str, str]],
+) -> Iterator[FileEntry]:
+    """Yield the files to copy, making folders and symlinks before the files they hold."""
+    stack = [(src_folder, dst_folder, 0)]
+    while stack:
+        src_dir, dst_dir, depth = stack.pop()
+        try:
+            os.makedirs(dst_dir, exist_ok=True)
+            with os.scandir(src_dir) as scan:
+                entries = list(scan)
+        except OSError as e:
+            failed.append((src_dir, str(e)))
+            continue
+        folders.append((src_dir, dst_dir))
+        for entry in entries:
+            dst_path = os.path.join(dst_dir, entry.name)
+            try:
+                if entry.is_symlink():
+                    changed = _copy_symlink(entry.path, dst_path)
+                    (copied if changed else skipped).append(entry.path)
+                elif entry.is_dir():
+                    stack.append((entry.path, dst_path, depth + 1))
+                elif entry.is_file():
+                    stat = entry.stat()
+                    yield FileEntry(
+                        entry.path, stat.st_size, stat.st_mtime, stat.st_ino, stat.st_dev, depth
+                    )
+                else:
+                    failed.append((entry.path, "unsupported file type"))
+            except OSError as e:
+                failed.append((entry.path, str(e)))
+
+
+def copy_tree(
+    src_folder: Path | str,
+    dst_folder: Path | str,
+    max_workers: int = 8,
+    preserve_metadata: bool = True,
+    skip_identical: bool = True,
+    progress: Optional[Callable[[int, int, float], None]] = None,
+) -> CopyResult:
+    """
+    Copy the tree under `src_folder` to `dst_folder`, files on `max_workers` threads.
+
+    Folders are recreated and symlinks are copied as symlinks, like
+    `shutil.copytree(symlinks=True)`. Files whose size and mtime already match
+    at the destination are skipped. Entries that can not be copied, special
+    files included, are listed in `failed`. `progress` is called after each
+    file with the files done, bytes copied and bytes/sec so far.
+    """
+    from util_common.decorator import parallel_map
+
+    src_folder, dst_folder = str(src_folder), str(dst_folder)
+    copied: List[str] = []
+    skipped: List[str] = []
+    failed: List[Tuple[str, str]] = []
+    folders: List[Tuple[str, str]] = []
+
+    def _copy(entry: FileEntry) -> Tuple[str, str, int]:
+        dst_path = os.path.join(dst_folder, os.path.relpath(entry.path, src_folder))
+        if skip_identical and _is_identical(entry, dst_path):
+            return entry.path, "", -1
+        try:
+            return entry.path, "", copy_file(entry.path, dst_path, preserve_metadata)
+        except OSError as e:
+            return entry.path, str(e), 0
+
+    n_bytes = 0
+    start = time.monotonic()
+    entries = _walk_copy_tree(src_folder, dst_folder, copied, skipped, failed, folders)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for path, error, size in parallel_map(_copy, entries, executor=executor, ordered=False):
+            if error:
+                failed.append((path, error))
+            elif size < 0:
+                skipped.append(path)
+            else:
+                copied.append(path)
+                n_bytes += size
+            if progress is not None:
+                elapsed = time.monotonic() - start
+                n_files = len(copied) + len(skipped) + len(failed)
+                progress(n_files, n_bytes, n_bytes / elapsed if elapsed > 0 else 0.0)
+    if preserve_metadata:
+        # Deepest first, copying into a folder changes its mtime.
+        for src_dir, dst_dir in reversed(folders):
+            try:
+                shutil.copystat(src_dir, dst_dir)
+            except OSError as e:
+                failed.append((src_dir, str(e)))
+    return CopyResult(copied, skipped, failed, n_bytes, time.monotonic() - start)
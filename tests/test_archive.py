@@ -0,0 +1,162 @@
+import io
+import os
+import shutil
+import sys
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from util_common.archive import Archive, _parse_seven_zip_listing, iter_archive
+
+SEVEN_ZIP_LISTING = """
+7-Zip [64] 16.02 : Copyright (c) 1999-2016 Igor Pavlov : 2016-05-21
+
+Listing archive: test.7z
+
+--
+Path = test.7z
+Type = 7z
+Physical Size = 230
+
+----------
+Path = docs
+Size = 0
+Attributes = D_ drwxr-xr-x
+
+Path = docs/a.txt
+Size = 5
+Attributes = A_ -rw-r--r--
+
+Path = b.pdf
+Size = 1024
+Attributes = A_ -rw-r--r--
+"""
+
+
+def _zip_bytes(files: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for name, content in files.items():
+            zip_file.writestr(name, content)
+    return buffer.getvalue()
+
+
+def test_archive(tmp_path: Path):
+    path = tmp_path.joinpath('outer.zip')
+    inner = _zip_bytes({'c.txt': 'inner', '__MACOSX/._c.txt': 'junk'})
+    files = {
+        'docs/a.txt': 'hello',
+        'b.txt': 'world' * 10000,
+        '__MACOSX/docs/._a.txt': 'junk',
+        'docs/inner.zip': inner,
+        'docs/no_extension': inner,
+    }
+    path.write_bytes(_zip_bytes(files))
+
+    with Archive(path) as archive:
+        assert archive.names() == ['docs/a.txt', 'b.txt', 'docs/inner.zip', 'docs/no_extension']
+        assert archive.members()[1].size == 50000
+        assert archive.read('docs/a.txt') == b'hello'
+        with archive.open('b.txt') as f:
+            assert f.read(5) == b'world'
+        assert archive.guess_extension('docs/no_extension') == 'zip'
+
+        dst = tmp_path.joinpath('dst')
+        extracted = archive.extract(dst, ['docs/a.txt', 'b.txt'])
+        assert extracted == [str(dst.joinpath('docs', 'a.txt')), str(dst.joinpath('b.txt'))]
+        assert dst.joinpath('b.txt').read_text() == files['b.txt']
+        assert sorted(os.listdir(dst)) == ['b.txt', 'docs']
+
+    contents = {name: f.read() for name, f in iter_archive(path, tmp_dir=tmp_path)}
+    assert contents == {
+        'docs/a.txt': b'hello',
+        'b.txt': files['b.txt'].encode(),
+        'docs/inner.zip/c.txt': b'inner',
+        'docs/no_extension/c.txt': b'inner',
+    }
+    assert [name for name, _ in iter_archive(path, recursive=False)][2:] == [
+        'docs/inner.zip',
+        'docs/no_extension',
+    ]
+
+
+def test_parse_seven_zip_listing():
+    members = _parse_seven_zip_listing(SEVEN_ZIP_LISTING)
+    assert [(x.name, x.size, x.is_dir) for x in members] == [
+        ('docs', 0, True),
+        ('docs/a.txt', 5, False),
+        ('b.pdf', 1024, False),
+    ]
+
+
+@pytest.mark.skipif(shutil.which('7z') is None, reason='p7zip is not installed')
+def test_seven_zip_archive(tmp_path: Path):
+    tmp_path.joinpath('src', 'docs').mkdir(parents=True)
+    tmp_path.joinpath('src', 'docs', 'a.txt').write_text('hello')
+    archive_path = tmp_path.joinpath('test.7z')
+    os.system(f'cd {tmp_path.joinpath("src")} && 7z a -bd {archive_path} docs > /dev/null')
+    with Archive(archive_path) as archive:
+        assert archive.names() == ['docs/a.txt']
+        assert archive.read('docs/a.txt') == b'hello'
+        dst = tmp_path.joinpath('dst')
+        assert archive.extract(dst) == [str(dst.joinpath('docs', 'a.txt'))]
+        assert dst.joinpath('docs', 'a.txt').read_text() == 'hello'
+
+
+RAR_LISTING = """
+UNRAR 6.21 freeware      Copyright (c) 1993-2023 Alexander Roshal
+
+Archive: test.rar
+Details: RAR 5
+
+        Name: docs
+        Type: Directory
+       mTime: 2024-01-01 00:00:00,000000000
+  Attributes: drwxr-xr-x
+
+        Name: docs/a.txt
+        Type: File
+        Size: 5
+ Packed size: 5
+  Attributes: -rw-r--r--
+
+        Name: bad.txt
+        Type: File
+        Size: 100
+  Attributes: -rw-r--r--
+"""
+
+FAKE_UNRAR = f"""#!{sys.executable}
+import sys
+
+assert sys.argv[sys.argv.index('--') + 1].endswith('test.rar')
+if sys.argv[1] == 'lt':
+    sys.stdout.write({RAR_LISTING!r})
+elif sys.argv[1] == 'p':
+    if sys.argv[-1] == 'bad.txt':
+        sys.stdout.write('trunc')
+        sys.exit(3)
+    sys.stdout.write('hello' * 100000)
+"""
+
+
+def test_rar_archive(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    bin_dir = tmp_path.joinpath('bin')
+    bin_dir.mkdir()
+    unrar = bin_dir.joinpath('unrar')
+    unrar.write_text(FAKE_UNRAR)
+    unrar.chmod(0o755)
+    monkeypatch.setenv('PATH', f'{bin_dir}{os.pathsep}{os.environ["PATH"]}')
+
+    with Archive(tmp_path.joinpath('test.rar')) as archive:
+        assert [(x.name, x.size, x.is_dir) for x in archive.members()] == [
+            ('docs', 0, True),
+            ('docs/a.txt', 5, False),
+            ('bad.txt', 100, False),
+        ]
+        assert archive.read('docs/a.txt') == b'hello' * 100000
+        with archive.open('docs/a.txt') as f:
+            assert f.read(5) == b'hello'  # stopping early is not an error
+        with pytest.raises(OSError):
+            archive.read('bad.txt')
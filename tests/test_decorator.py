@@ -1,7 +1,29 @@
+import asyncio
+import sqlite3
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from math import isclose
+from pathlib import Path
 
-from util_common.decorator import ticktock
+import pytest
+
+from util_common.decorator import (
+    ConnectionPool,
+    RetryBudget,
+    TimingRegistry,
+    batched,
+    cached,
+    connect_pool,
+    get_proxies,
+    limit_concurrency,
+    offload,
+    parallel_map,
+    rate_limit,
+    retry,
+    scoped_proxy,
+    ticktock,
+)
 
 
 def test_ticktock():
@@ -13,3 +35,341 @@ def test_ticktock():
     sleep_seconds(1)
     end = time.time()
     assert isclose(end - start, 1, abs_tol=1e-2)
+
+
+def test_ticktock_registry():
+    registry = TimingRegistry()
+
+    @ticktock(registry=registry)
+    def fast(i: int):
+        return i
+
+    @ticktock(name='slow', registry=registry)
+    async def slow():
+        await asyncio.sleep(0.01)
+
+    threads = [threading.Thread(target=lambda: [fast(i) for i in range(1000)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    asyncio.run(slow())
+
+    snapshot = registry.snapshot()
+    assert snapshot['fast'].calls == 4000
+    assert snapshot['fast'].min_ns <= snapshot['fast'].p50_ns <= snapshot['fast'].p99_ns
+    assert snapshot['fast'].p99_ns <= snapshot['fast'].max_ns
+    assert snapshot['slow'].calls == 1
+    assert snapshot['slow'].p50_ns >= 1e7
+
+    messages = []
+    registry.emit(messages.append, reset=True)
+    assert len(messages) == 2
+    assert registry.snapshot() == {}
+
+
+def test_retry():
+    calls = []
+
+    @retry(max_attempts=3, delay=0.01, backoff=2, jitter=0.5, exceptions=(ValueError,))
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ValueError()
+        return len(calls)
+
+    assert flaky() == 3
+
+    @retry(max_attempts=3, delay=0.01, exceptions=(ValueError,))
+    def wrong_type():
+        calls.append(1)
+        raise KeyError()
+
+    calls.clear()
+    with pytest.raises(KeyError):
+        wrong_type()
+    assert len(calls) == 1
+
+
+def test_retry_async_budget():
+    budget = RetryBudget(max_failure_rate=0.5, min_attempts=4)
+    calls = []
+
+    @retry(max_attempts=10, delay=0, budget=budget)
+    async def failing():
+        calls.append(1)
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        asyncio.run(failing())
+    assert len(calls) == 4
+
+
+def test_connection_pool(tmp_path: Path):
+    db_path = tmp_path.joinpath('pool.db')
+    pool = ConnectionPool(
+        lambda: sqlite3.connect(db_path, check_same_thread=False),
+        min_size=1,
+        max_size=2,
+        timeout=0.1,
+    )
+
+    @connect_pool(pool)
+    def insert(cur, value: int, fail: bool = False):
+        cur.execute('INSERT INTO t VALUES (?)', (value,))
+        if fail:
+            raise ValueError()
+
+    @connect_pool(pool)
+    def count(cur) -> int:
+        cur.execute('SELECT COUNT(*) FROM t')
+        return cur.fetchone()[0]
+
+    with pool.connection() as con:
+        con.execute('CREATE TABLE t (v INTEGER)')
+    insert(value=1)
+    with pytest.raises(ValueError):
+        insert(value=2, fail=True)
+    assert count() == 1
+
+    first = pool.acquire()
+    second = pool.acquire()
+    with pytest.raises(TimeoutError):
+        pool.acquire()
+    second.close()  # broken connections are replaced on checkout
+    pool.release(second)
+    third = pool.acquire()
+    assert third is not second
+    pool.release(first)
+    pool.release(third)
+    pool.close()
+
+
+def test_connection_pool_rollback_error():
+    class BrokenConnection:
+        def rollback(self):
+            raise ConnectionError()
+
+        def close(self):
+            pass
+
+    pool = ConnectionPool(BrokenConnection, min_size=0, max_size=1, health_check=None)
+    with pytest.raises(ValueError):
+        with pool.connection():
+            raise ValueError()
+    assert pool._size == 0
+
+
+def test_scoped_proxy():
+    def fetch(_):
+        return get_proxies()
+
+    fetch_a = scoped_proxy(http_proxy='http://a:1')(fetch)
+    fetch_b = scoped_proxy(https_proxy='http://b:2')(fetch)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results_a = executor.map(fetch_a, range(100))
+        results_b = executor.map(fetch_b, range(100))
+        assert all(x == {'http': 'http://a:1'} for x in results_a)
+        assert all(x == {'https': 'http://b:2'} for x in results_b)
+
+    @scoped_proxy(all_proxy='socks5://c:3')
+    async def async_fetch():
+        await asyncio.sleep(0)
+        return get_proxies()
+
+    async def main():
+        return await asyncio.gather(async_fetch(), asyncio.sleep(0, result=get_proxies()))
+
+    assert asyncio.run(main()) == [{'all': 'socks5://c:3'}, {}]
+    assert get_proxies() == {}
+
+
+def test_cached(tmp_path: Path):
+    calls = []
+
+    @cached(max_entries=2, disk_path=tmp_path.joinpath('cache.db'))
+    def square(x: int) -> int:
+        calls.append(x)
+        time.sleep(0.05)
+        return x * x
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert list(executor.map(square, [3] * 8)) == [9] * 8
+    assert calls == [3]
+
+    square(1)
+    square(2)  # evicts 3 from memory, the disk still has it
+    assert square.cache_info().evictions == 1
+    assert square(3) == 9
+    assert calls == [3, 1, 2]
+
+    @cached(ttl=0.05)
+    async def double(x: int) -> int:
+        calls.append(x)
+        await asyncio.sleep(0.01)
+        return x * 2
+
+    async def main():
+        return await asyncio.gather(*[double(5) for _ in range(5)])
+
+    calls.clear()
+    assert asyncio.run(main()) == [10] * 5
+    time.sleep(0.06)
+    assert asyncio.run(double(5)) == 10
+    assert calls == [5, 5]
+    assert double.cache_info().expirations == 1
+
+
+def test_cached_shared_disk(tmp_path: Path):
+    disk_path = tmp_path.joinpath('cache.db')
+
+    @cached(max_entries=0, disk_path=disk_path)  # only the disk keeps entries
+    def f(x: int):
+        return 'f', x
+
+    @cached(max_entries=0, disk_path=disk_path)
+    def g(x: int):
+        return 'g', x
+
+    assert f(1) == ('f', 1)
+    assert g(1) == ('g', 1)
+    f.cache_clear()
+    assert g(1) == ('g', 1)
+    assert g.cache_info().hits == 1
+
+
+def test_cached_async_leader_cancelled():
+    calls = []
+
+    @cached()
+    async def slow(x: int) -> int:
+        calls.append(x)
+        await asyncio.sleep(0.05)
+        return x
+
+    async def main():
+        leader = asyncio.create_task(slow(1))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.create_task(slow(1)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await asyncio.gather(*followers)
+
+    assert asyncio.run(main()) == [1] * 3
+    assert calls == [1, 1]
+
+
+def test_rate_limit():
+    @rate_limit(rate=100, burst=10, key='test_rate_limit')
+    def call():
+        return time.monotonic()
+
+    @rate_limit(rate=100, burst=10, key='test_rate_limit')
+    async def async_call():
+        return time.monotonic()
+
+    async def main():
+        return await asyncio.gather(*[async_call() for _ in range(20)])
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda _: call(), range(20)))
+    asyncio.run(main())
+    # 10 burst tokens, then 30 calls at 100/sec over the shared limiter
+    assert time.monotonic() - start >= 0.29
+
+
+def test_limit_concurrency():
+    in_flight = []
+    peak = []
+
+    @limit_concurrency(2, key='test_limit_concurrency')
+    def call():
+        in_flight.append(1)
+        peak.append(len(in_flight))
+        time.sleep(0.01)
+        in_flight.pop()
+
+    @limit_concurrency(2, key='test_limit_concurrency')
+    async def async_call():
+        in_flight.append(1)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.pop()
+
+    async def main():
+        await asyncio.gather(*[async_call() for _ in range(10)])
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [executor.submit(call) for _ in range(10)]
+        asyncio.run(main())
+        for future in futures:
+            future.result()
+    assert max(peak) == 2
+    assert len(peak) == 20
+
+
+def test_batched():
+    batches = []
+
+    @batched(max_size=10, max_wait=0.05)
+    def load(keys):
+        batches.append(keys)
+        return {key: ValueError(key) if key < 0 else key * 2 for key in keys}
+
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        futures = [executor.submit(load, x % 15) for x in range(20)] + [executor.submit(load, -1)]
+        assert [f.result() for f in futures[:-1]] == [x % 15 * 2 for x in range(20)]
+        with pytest.raises(ValueError):
+            futures[-1].result()
+    assert len(batches) < 21
+    assert all(len(set(x)) == len(x) <= 10 for x in batches)
+
+    @batched(max_size=4, max_wait=0.01)
+    async def async_load(keys):
+        batches.append(keys)
+        return [key * 3 for key in keys]
+
+    async def main():
+        return await asyncio.gather(*[async_load(x) for x in [1, 2, 2, 3, 4, 5]])
+
+    batches.clear()
+    assert asyncio.run(main()) == [3, 6, 6, 9, 12, 15]
+    assert batches == [[1, 2, 3, 4], [5]]
+
+
+def _square(x: int) -> int:
+    return x * x
+
+
+@offload(kind='process')
+def offloaded_square(x: int) -> int:
+    return x * x
+
+
+def test_offload():
+    @offload()
+    def blocking_sleep(s: float) -> float:
+        time.sleep(s)
+        return s
+
+    async def main():
+        start = time.monotonic()
+        results = await asyncio.gather(*[blocking_sleep(0.1) for _ in range(4)])
+        return results, time.monotonic() - start
+
+    results, elapsed = asyncio.run(main())
+    assert results == [0.1] * 4
+    assert elapsed < 0.3
+    assert asyncio.run(offloaded_square(3)) == 9
+
+
+def test_parallel_map():
+    assert list(parallel_map(_square, range(100), chunksize=7)) == [x * x for x in range(100)]
+    assert sorted(parallel_map(_square, iter(range(100)), ordered=False, max_in_flight=2)) == [
+        x * x for x in range(100)
+    ]
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        assert list(parallel_map(_square, range(10), executor=executor)) == [
+            x * x for x in range(10)
+        ]
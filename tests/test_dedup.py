@@ -0,0 +1,83 @@
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+import util_common.dedup as dedup
+from util_common.dedup import find_duplicates, remove_duplicates
+from util_common.path import FileEntry
+
+
+def _make_tree(root: Path) -> None:
+    large = os.urandom(300 * 1024)
+    for i in range(3):
+        root.joinpath(f'd{i}').mkdir(parents=True)
+        root.joinpath(f'd{i}', 'small.txt').write_text('same')
+        root.joinpath(f'd{i}', f'large_{i}.pdf').write_bytes(large)
+        root.joinpath(f'd{i}', 'unique.txt').write_text(f'unique {i}')
+    # same size, first and last blocks as `large`, different middle
+    root.joinpath('d0', 'almost.pdf').write_bytes(large[:150000] + b'x' + large[150001:])
+    os.link(root.joinpath('d0', 'small.txt'), root.joinpath('d0', 'link.txt'))
+
+
+def test_find_duplicates(tmp_path: Path):
+    _make_tree(tmp_path)
+    groups = find_duplicates(tmp_path, block_size=4096)
+    assert [len(x.paths) for x in groups] == [3, 3]
+    assert groups[0].paths == [str(tmp_path.joinpath(f'd{i}', f'large_{i}.pdf')) for i in range(3)]
+    assert groups[0].size == 300 * 1024
+    assert {os.path.basename(x) for x in groups[1].paths} <= {'small.txt', 'link.txt'}
+
+    trash_dir = tmp_path.joinpath('trash')
+    assert remove_duplicates(groups[:1], trash_dir=trash_dir) == 2 * 300 * 1024
+    assert sorted(os.listdir(trash_dir)) == ['large_1.pdf', 'large_2.pdf']
+    assert remove_duplicates(groups[1:], hardlink=True) == 2 * 4
+    assert tmp_path.joinpath('d2', 'small.txt').stat().st_nlink == 4
+    assert find_duplicates(tmp_path, ignore_names=['trash']) == []
+
+
+def test_find_duplicates_parallel(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    for i in range(8):
+        for name in 'ab':
+            tmp_path.joinpath(f'{name}{i}.txt').write_text('x' * (i + 1))
+    active = []
+    max_active = []
+    lock = threading.Lock()
+    hash_blocks = dedup._hash_blocks
+
+    def slow_hash_blocks(*args):
+        with lock:
+            active.append(1)
+            max_active.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.pop()
+        return hash_blocks(*args)
+
+    monkeypatch.setattr(dedup, '_hash_blocks', slow_hash_blocks)
+    groups = find_duplicates(tmp_path, max_workers=8)
+    assert len(groups) == 8
+    assert max(max_active) > 2  # not limited to the 2 files of a size group
+
+
+def test_find_duplicates_devices(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    for name in 'ab':
+        tmp_path.joinpath(f'{name}.txt').write_text('same')
+    inode = os.stat(tmp_path.joinpath('a.txt')).st_ino
+
+    def walk_files(folder, **kwargs):
+        # the same inode number on two filesystems is not a hard link
+        for dev, name in enumerate('ab'):
+            yield FileEntry(str(tmp_path.joinpath(f'{name}.txt')), 4, 0, inode, dev, 0)
+
+    monkeypatch.setattr(dedup, 'walk_files', walk_files)
+    assert [len(x.paths) for x in find_duplicates(tmp_path)] == [2]
+
+
+def test_hash_full_empty_file(tmp_path: Path):
+    path = tmp_path.joinpath('empty')
+    path.touch()  # truncated since the walk, mmap refuses empty files
+    assert dedup._hash_full(str(path), 1, 'sha256', 4096) == hashlib.sha256().hexdigest()
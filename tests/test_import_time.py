@@ -0,0 +1,66 @@
+import re
+import subprocess
+import sys
+
+import pytest
+
+# Cumulative `python -X importtime` budget per public module, in microseconds.
+IMPORT_TIME_BUDGETS = {
+    'util_common._cfg': 50000,
+    'util_common._log': 75000,
+    'util_common.archive': 150000,
+    'util_common.datetime': 50000,
+    'util_common.decorator': 200000,
+    'util_common.dedup': 150000,
+    'util_common.index': 150000,
+    'util_common.io': 150000,
+    'util_common.logger': 500000,
+    'util_common.package': 150000,
+    'util_common.path': 150000,
+    'util_common.singleton': 50000,
+    'util_common.sys': 75000,
+    'util_common.uuid': 75000,
+}
+
+LAZY_MODULES = [
+    'magic',
+    'natsort',
+    'colorlog',
+    'rich',
+    'pythonjsonlogger',
+]
+
+IMPORT_TIME_PATTERN = re.compile(r'import time:\s+\d+ \|\s+(\d+) \|\s+(\S+)$')
+
+
+def _import_time(module: str, repeat: int = 3) -> int:
+    timings = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        for line in result.stderr.splitlines():
+            matches = IMPORT_TIME_PATTERN.match(line)
+            if matches is not None and matches.group(2) == module:
+                timings.append(int(matches.group(1)))
+    return min(timings)
+
+
+@pytest.mark.parametrize('module', IMPORT_TIME_BUDGETS.keys())
+def test_import_time(module: str):
+    assert _import_time(module) <= IMPORT_TIME_BUDGETS[module]
+
+
+def test_lazy_imports():
+    modules = ', '.join(IMPORT_TIME_BUDGETS.keys())
+    result = subprocess.run(
+        [sys.executable, '-c', f'import sys, {modules}; print(*sys.modules)'],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imported = {x.split('.')[0] for x in result.stdout.split()}
+    assert imported.isdisjoint(LAZY_MODULES)
@@ -0,0 +1,85 @@
+import os
+from pathlib import Path
+
+import pytest
+
+import util_common.index as index_module
+from util_common.index import DirectoryIndex
+
+
+def test_directory_index(tmp_path: Path):
+    root = tmp_path.joinpath('root')
+    for i in range(10):
+        path = root.joinpath(f'd{i % 3}', f'f{i}.txt')
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(str(i))
+    index_path = tmp_path.joinpath('index', 'root.sqlite')
+
+    with DirectoryIndex(root, index_path, hash_content=True) as index:
+        changes = index.scan()
+        assert len(changes.added) == 10
+        assert changes.modified == changes.deleted == []
+        assert index.scan() == ([], [], [])
+
+    root.joinpath('d0', 'f0.txt').write_text('changed')
+    root.joinpath('d1', 'f1.txt').unlink()
+    root.joinpath('d2', 'new.txt').write_text('new')
+    touched = root.joinpath('d2', 'f2.txt')
+    os.utime(touched, (0, 0))  # stat changes, content does not
+
+    with DirectoryIndex(root, index_path, hash_content=True) as index:
+        changes = index.scan()
+        assert changes.added == [str(root.joinpath('d2', 'new.txt'))]
+        assert changes.modified == [str(root.joinpath('d0', 'f0.txt'))]
+        assert changes.deleted == [str(root.joinpath('d1', 'f1.txt'))]
+        assert len(index) == 10
+        indexed = index.get(touched)
+        assert indexed is not None and indexed.mtime == 0
+
+
+def test_directory_index_vanished_file(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    root = tmp_path.joinpath('root')
+    root.mkdir()
+    for i in range(3):
+        root.joinpath(f'f{i}.txt').write_text(str(i))
+    vanished = str(root.joinpath('f1.txt'))
+
+    def hash_file(path: str, algorithm: str) -> str:
+        if path == vanished:
+            raise FileNotFoundError(path)  # removed between the walk and the hash
+        return path
+
+    monkeypatch.setattr(index_module, 'hash_file', hash_file)
+    with DirectoryIndex(root, tmp_path.joinpath('index.sqlite'), hash_content=True) as index:
+        changes = index.scan()
+        assert sorted(changes.added) == [str(root.joinpath(f'f{i}.txt')) for i in (0, 2)]
+        assert index.get(vanished) is None
+
+
+def test_directory_index_unreadable_folder(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    root = tmp_path.joinpath('root')
+    for name in ['a', 'b', 'bc']:
+        root.joinpath(name).mkdir(parents=True)
+        root.joinpath(name, 'f.txt').write_text(name)
+    index_path = tmp_path.joinpath('index.sqlite')
+    with DirectoryIndex(root, index_path) as index:
+        assert len(index.scan().added) == 3
+
+    root.joinpath('bc', 'f.txt').unlink()
+    unreadable = str(root.joinpath('b'))
+    scandir = os.scandir
+
+    def failing_scandir(path):
+        if path == unreadable:
+            raise PermissionError(13, 'Permission denied', path)
+        return scandir(path)
+
+    monkeypatch.setattr(os, 'scandir', failing_scandir)
+    with DirectoryIndex(root, index_path) as index:
+        assert index.scan() == ([], [], [str(root.joinpath('bc', 'f.txt'))])
+        assert index.get(root.joinpath('b', 'f.txt')) is not None
+
+    monkeypatch.setattr(os, 'scandir', scandir)
+    root.joinpath('b', 'f.txt').unlink()
+    with DirectoryIndex(root, index_path) as index:
+        assert index.scan() == ([], [], [str(root.joinpath('b', 'f.txt'))])
@@ -1 +1,116 @@
-# TODO:
+import base64
+import io
+import json
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from util_common.io import (
+    b64decode_to,
+    b64encode_to,
+    guess_file_extension,
+    guess_path_extensions,
+    iter_b64decode,
+    iter_b64encode,
+    json_to_compact_bytes,
+    read_jsonl,
+    write_data_url,
+    write_json_array,
+    write_jsonl,
+)
+
+
+def test_jsonl(tmp_path: Path):
+    records = ({'id': i, 'text': f'记录 {i}', 'tags': {1: 'a'}} for i in range(1000))
+    path = tmp_path.joinpath('records', 'records.jsonl')
+    assert write_jsonl(records, path) == 1000
+    assert write_jsonl([{'id': 1000}], path, append=True) == 1
+
+    loaded = read_jsonl(path)
+    assert next(loaded) == {'id': 0, 'text': '记录 0', 'tags': {'1': 'a'}}
+    assert sum(1 for _ in loaded) == 1000
+
+    stream = io.BytesIO()
+    write_jsonl([[1, 2], None], stream)
+    stream.seek(0)
+    assert list(read_jsonl(stream)) == [[1, 2], None]
+
+
+def test_json_array(tmp_path: Path):
+    path = tmp_path.joinpath('records.json')
+    assert write_json_array(({'id': i} for i in range(3)), path) == 3
+    assert json.loads(path.read_bytes()) == [{'id': 0}, {'id': 1}, {'id': 2}]
+    assert json_to_compact_bytes({'a': [1, 'é']}) == '{"a":[1,"é"]}'.encode('utf-8')
+
+
+def test_b64_stream(tmp_path: Path):
+    content = bytes(range(256)) * 1000 + b'tail'
+    src = tmp_path.joinpath('content.bin')
+    src.write_bytes(content)
+    encoded = base64.b64encode(content)
+
+    assert b''.join(iter_b64encode(src, chunk_size=999)) == encoded
+    assert b''.join(iter_b64encode(memoryview(content), chunk_size=999)) == encoded
+    with pytest.raises(ValueError):
+        next(iter_b64encode(content, chunk_size=1000))
+
+    b64_path = tmp_path.joinpath('content.b64')
+    assert b64encode_to(io.BytesIO(content), b64_path) == len(encoded)
+    assert b''.join(iter_b64decode(b64_path, chunk_size=1001)) == content
+    wrapped = base64.encodebytes(content)  # with newlines every 76 chars
+    assert b''.join(iter_b64decode(wrapped, chunk_size=1001)) == content
+
+    decoded = io.BytesIO()
+    assert b64decode_to(b64_path, decoded) == len(content)
+    assert decoded.getvalue() == content
+
+    url_path = tmp_path.joinpath('content.url')
+    write_data_url(src, url_path, 'pdf')
+    assert url_path.read_bytes() == b'data:application/pdf;base64,' + encoded
+
+
+def _make_zip(names) -> bytes:
+    stream = io.BytesIO()
+    with zipfile.ZipFile(stream, 'w') as zip_file:
+        for name in names:
+            zip_file.writestr(name, b'<xml/>')
+    return stream.getvalue()
+
+
+def _make_ole(stream_name: str) -> bytes:
+    header = bytearray(512)
+    header[:8] = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+    header[30:32] = (9).to_bytes(2, 'little')  # 512 bytes sectors
+    header[48:52] = (2).to_bytes(4, 'little')  # directory in the third sector
+    directory = stream_name.encode('utf-16-le').ljust(512, b'\x00')
+    return bytes(header) + bytes(1024) + directory
+
+
+def test_guess_file_extension(tmp_path: Path):
+    contents = {
+        'a.7z': b'7z\xbc\xaf\x27\x1c' + bytes(32),
+        'a.rar': b'Rar!\x1a\x07\x01\x00' + bytes(32),
+        'a.png': b'\x89PNG\r\n\x1a\n' + bytes(32),
+        'a.jpg': b'\xff\xd8\xff\xe0' + bytes(32),
+        'a.pdf': b'%PDF-1.7\n' + bytes(32),
+        'a.zip': _make_zip(['password/a.txt']),
+        'a.docx': _make_zip(['[Content_Types].xml', 'word/document.xml']),
+        'a.xlsx': _make_zip(['[Content_Types].xml', 'xl/workbook.xml']),
+        'a.doc': _make_ole('WordDocument'),
+        'a.xls': _make_ole('Workbook'),
+        'a.html': b'\n<!DOCTYPE html><html></html>',
+        'a.json': '{"名字": 1}'.encode('utf-8'),
+        'a.txt': b'plain text',
+    }
+    paths = []
+    for name, content in contents.items():
+        expected = name.split('.')[-1]
+        assert guess_file_extension(content) == expected
+        paths.append(tmp_path.joinpath(name))
+        paths[-1].write_bytes(content)
+    assert guess_path_extensions(paths) == [x.split('.')[-1] for x in contents.keys()]
+
+    assert guess_file_extension(b'{"a": 1}\n{"b": [1, 2') == 'json'  # json lines cut by the header
+    for content in [b'[section]\nkey = 1\n', b'[link](https://example.com)\n', b'{\\rtf1}']:
+        assert guess_file_extension(content) != 'json'
@@ -1,11 +1,28 @@
+import gzip
 import json
+import logging
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import pytest
 
 from util_common._cfg import APP_NAME
 from util_common._log import log
-from util_common.logger import LogSettings, setup_logger
+from util_common.logger import (
+    LOG_FORMAT,
+    LOG_KEYS,
+    BoundedQueueHandler,
+    CustomJsonFormatter,
+    FastJsonFormatter,
+    FloodControlFilter,
+    LogSettings,
+    setup_log_aggregator,
+    setup_logger,
+    setup_worker_loggers,
+    shutdown_loggers,
+)
 from util_common.path import clear_folder
 
 
@@ -34,3 +51,233 @@ def test_log(log_dir: Path):
     assert len(log_lines) == 1
     message = json.loads(log_lines[0]).get('message')
     assert message == info_message
+
+
+def test_queue_log(tmp_path: Path):
+    log_dir = tmp_path
+    name = 'queue_logger'
+    setup_logger(
+        LogSettings(
+            name=name,
+            level='info',
+            save_file_or_dir=log_dir,
+            queue_handler=True,
+        )
+    )
+    logger = logging.getLogger(name)
+    assert isinstance(logger.handlers[0], BoundedQueueHandler)
+    for i in range(100):
+        logger.info(f"queued {i}")
+    shutdown_loggers()
+
+    log_lines = log_dir.joinpath(f'{name}.log').read_text().splitlines()
+    assert len(log_lines) == 100
+    assert log_lines[-1].endswith('queued 99\x1b[0m')
+
+
+def test_queue_overflow():
+    record = logging.LogRecord('overflow', logging.INFO, __file__, 0, 'msg', None, None)
+
+    drop_newest = BoundedQueueHandler(queue.Queue(maxsize=2), 'drop_newest')
+    for i in range(5):
+        drop_newest.emit(logging.makeLogRecord({**record.__dict__, 'msg': str(i)}))
+    assert drop_newest.dropped == 3
+    assert [drop_newest.queue.get_nowait().msg for _ in range(2)] == ['0', '1']
+
+    drop_oldest = BoundedQueueHandler(queue.Queue(maxsize=2), 'drop_oldest')
+    for i in range(5):
+        drop_oldest.emit(logging.makeLogRecord({**record.__dict__, 'msg': str(i)}))
+    assert drop_oldest.dropped == 3
+    assert [drop_oldest.queue.get_nowait().msg for _ in range(2)] == ['3', '4']
+
+    stopping = BoundedQueueHandler(queue.Queue(maxsize=2), 'drop_oldest')
+    stopping.queue.put_nowait(None)  # the listener's stop sentinel
+    stopping.queue.put_nowait(record)
+    stopping.emit(record)
+    assert stopping.dropped == 1
+    assert stopping.queue.get_nowait() is record
+    assert stopping.queue.get_nowait() is None
+
+
+def test_fast_json_formatter():
+    record = logging.LogRecord('fast', logging.INFO, __file__, 1, 'hello %s', ('world',), None)
+    expected = json.loads(CustomJsonFormatter(LOG_FORMAT).format(record))
+    formatted = json.loads(FastJsonFormatter().format(record))
+    assert list(formatted.keys()) == LOG_KEYS
+    assert formatted == expected
+
+
+def test_buffered_rotating_log(tmp_path: Path):
+    log_dir = tmp_path
+    name = 'buffered_logger'
+    setup_logger(
+        LogSettings(
+            name=name,
+            level='info',
+            save_file_or_dir=log_dir,
+            file_handler='buffered',
+            file_max_bytes=1024,
+            file_backup_count=2,
+        )
+    )
+    logger = logging.getLogger(name)
+    for i in range(100):
+        logger.info(f"buffered {i}")
+    for handler in logger.handlers:
+        handler.close()
+
+    backups = sorted(log_dir.glob(f'{name}.*.log.gz'))
+    assert len(backups) == 2
+    with gzip.open(backups[-1], 'rt') as f:
+        assert 'buffered' in f.readline()
+    assert (
+        log_dir.joinpath(f'{name}.log').read_text().splitlines()[-1].endswith('buffered 99\x1b[0m')
+    )
+
+
+def test_flood_control():
+    class ListHandler(logging.Handler):
+        def __init__(self):
+            super().__init__()
+            self.messages = []
+
+        def emit(self, record):
+            self.messages.append(record.getMessage())
+
+    logger = logging.getLogger('flood_logger')
+    handler = ListHandler()
+    logger.addHandler(handler)
+    logger.addFilter(FloodControlFilter(rate=1, burst=2, window=1))
+
+    def log_at(created: float, msg: str):
+        record = logging.LogRecord(logger.name, logging.ERROR, __file__, 1, msg, None, None)
+        record.created = created
+        logger.handle(record)
+
+    for _ in range(100):
+        log_at(0, 'retry')
+    log_at(0.1, 'other')
+    for _ in range(10):
+        log_at(0.2, 'flood')
+    log_at(2, 'recovered')
+
+    assert handler.messages == [
+        'retry',
+        'retry (repeated 99 times)',
+        'other',
+        'flood (repeated 10 times, 10 rate limited)',
+        'recovered',
+    ]
+
+
+def test_flood_control_flush():
+    class ListHandler(logging.Handler):
+        def __init__(self):
+            super().__init__()
+            self.messages = []
+
+        def emit(self, record):
+            self.messages.append(record.getMessage())
+
+    logger = logging.getLogger('flood_flush_logger')
+    handler = ListHandler()
+    logger.addHandler(handler)
+    logger.addFilter(FloodControlFilter(rate=1, burst=2, window=1))
+
+    def log_at(created: float, msg: str, lineno: int):
+        record = logging.LogRecord(logger.name, logging.ERROR, __file__, lineno, msg, None, None)
+        record.created = created
+        logger.handle(record)
+
+    for _ in range(1000):
+        log_at(0, 'retry', 1)
+    log_at(5, 'elsewhere', 2)
+    for _ in range(10):
+        log_at(6, 'again', 1)
+    shutdown_loggers()
+
+    assert handler.messages == [
+        'retry',
+        'retry (repeated 999 times)',
+        'elsewhere',
+        'again',
+        'again (repeated 9 times)',
+    ]
+
+    logger.filters[0].window = 0.05
+    handler.messages.clear()
+    for _ in range(10):
+        logger.error('timer')
+    time.sleep(0.3)
+    assert handler.messages == ['timer', 'timer (repeated 9 times)']
+
+
+@pytest.mark.parametrize('queue_handler', [False, True])
+def test_flood_control_child_logger(tmp_path: Path, queue_handler: bool):
+    name = f'flood_parent_{queue_handler}'
+    setup_logger(
+        LogSettings(
+            name=name,
+            save_file_or_dir=tmp_path,
+            queue_handler=queue_handler,
+            flood_control=True,
+            flood_rate=1,
+            flood_burst=1,
+            flood_window=60,
+        )
+    )
+    child = logging.getLogger(f'{name}.child')
+    for _ in range(50):
+        child.error('retry')
+    shutdown_loggers()
+
+    log_lines = tmp_path.joinpath(f'{name}.log').read_text().splitlines()
+    assert len(log_lines) == 2
+    assert 'repeated' not in log_lines[0]
+    assert 'retry (repeated 49 times)' in log_lines[1]
+
+
+def _log_from_worker(i: int) -> None:
+    logging.getLogger('aggregated_logger').info(f"worker {i}")
+
+
+def test_log_aggregator(tmp_path: Path):
+    log_dir = tmp_path
+    settings = [LogSettings(name='aggregated_logger', save_file_or_dir=log_dir)]
+    queue_ = setup_log_aggregator(settings)
+    with ProcessPoolExecutor(
+        max_workers=4,
+        initializer=setup_worker_loggers,
+        initargs=(queue_, settings),
+    ) as executor:
+        list(executor.map(_log_from_worker, range(200)))
+    shutdown_loggers()
+
+    log_lines = log_dir.joinpath('aggregated_logger.log').read_text().splitlines()
+    assert len(log_lines) == 200
+
+
+def test_ring_buffer_log(tmp_path: Path):
+    log_dir = tmp_path
+    name = 'ring_logger'
+    setup_logger(
+        LogSettings(
+            name=name,
+            level='info',
+            save_file_or_dir=log_dir,
+            ring_buffer=True,
+            ring_buffer_size=3,
+        )
+    )
+    logger = logging.getLogger(name)
+    log_path = log_dir.joinpath(f'{name}.log')
+    for i in range(5):
+        logger.debug(f"context {i}")
+    logger.info("running")
+    assert len(log_path.read_text().splitlines()) == 1
+
+    logger.error("failed")
+    log_lines = log_path.read_text().splitlines()
+    assert len(log_lines) == 5
+    assert 'context 2' in log_lines[1]
+    assert 'failed' in log_lines[-1]
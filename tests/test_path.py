@@ -1,6 +1,29 @@
+import errno
+import fcntl
+import os
+import random
+import shutil
 from pathlib import Path
 
-from util_common.path import get_absolute_cwd_path, normalize_path
+import natsort
+import pytest
+
+from util_common.path import (
+    TRASH_NAME,
+    clear_folder,
+    copy_file,
+    copy_tree,
+    duplicate,
+    get_absolute_cwd_path,
+    iter_sorted_paths,
+    move,
+    normalize_path,
+    recursive_list_files,
+    recursive_list_named_children,
+    sort_paths,
+    wait_for_trash,
+    walk_files,
+)
 
 
 def test_get_absolute_cwd_path():
@@ -15,3 +38,176 @@ def test_normalize_path():
     assert isinstance(name, str)
     assert isinstance(abs_path, Path)
     assert str(abs_path).endswith(name)
+
+
+def test_walk_files(tmp_path: Path):
+    for i in range(3):
+        for j in range(20):
+            path = tmp_path.joinpath(
+                *[f'd{k}' for k in range(i)], f'f{j}.{"txt" if j % 2 else "PDF"}'
+            )
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text('x' * j)
+    tmp_path.joinpath('__MACOSX').mkdir()
+    tmp_path.joinpath('__MACOSX', 'f.txt').write_text('x')
+    tmp_path.joinpath('.DS_Store').write_text('x')
+
+    entries = list(walk_files(tmp_path))
+    assert len(entries) == 60
+    entry = next(x for x in entries if x.path.endswith('f3.txt'))
+    assert entry.size == 3
+    assert entry.inode == os.stat(entry.path).st_ino
+
+    assert len(list(walk_files(tmp_path, extensions=['pdf']))) == 30
+    assert len(list(walk_files(tmp_path, patterns=['f1*'], max_depth=1))) == 22
+    assert {x.depth for x in walk_files(tmp_path, max_depth=1)} == {0, 1}
+    assert len(list(recursive_list_files(tmp_path, parallel=True))) == 60
+    assert len(list(recursive_list_named_children(tmp_path, 'f1.txt', parallel=True))) == 3
+
+
+def test_walk_files_error(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    for name in ['a', 'b']:
+        tmp_path.joinpath(name).mkdir()
+        tmp_path.joinpath(name, 'f.txt').write_text('x')
+    unreadable = str(tmp_path.joinpath('b'))
+    scandir = os.scandir
+
+    def failing_scandir(path):
+        if path == unreadable:
+            raise PermissionError(errno.EACCES, 'Permission denied', path)
+        return scandir(path)
+
+    monkeypatch.setattr(os, 'scandir', failing_scandir)
+    errors: list[OSError] = []
+    entries = list(walk_files(tmp_path, on_error=errors.append))
+    assert [x.path for x in entries] == [str(tmp_path.joinpath('a', 'f.txt'))]
+    assert [x.filename for x in errors] == [unreadable]
+
+
+def test_copy_tree(tmp_path: Path):
+    src = tmp_path.joinpath('src')
+    for i in range(3):
+        for j in range(10):
+            path = src.joinpath(f'folder_{i}', f'file_{j}.txt')
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(str(i * j) * 1000)
+    dst = tmp_path.joinpath('dst')
+    progress = []
+    result = copy_tree(src, dst, progress=lambda *args: progress.append(args))
+    assert len(result.copied) == 30 and not result.skipped and not result.failed
+    assert result.n_bytes == sum(x.stat().st_size for x in src.rglob('*.txt'))
+    assert len(progress) == 30 and progress[-1][1] == result.n_bytes
+    for path in src.rglob('*.txt'):
+        copied = dst.joinpath(path.relative_to(src))
+        assert copied.read_bytes() == path.read_bytes()
+        assert copied.stat().st_mtime == path.stat().st_mtime
+
+    src.joinpath('folder_0', 'file_0.txt').write_text('changed')
+    result = copy_tree(src, dst)
+    assert len(result.copied) == 1 and len(result.skipped) == 29
+    assert dst.joinpath('folder_0', 'file_0.txt').read_text() == 'changed'
+
+    src.joinpath('folder_1', 'file_1.txt').chmod(0)
+    dup_result = duplicate(src, tmp_path.joinpath('dup'), parallel=True)
+    assert dup_result is not None
+    if os.geteuid() != 0:
+        assert [os.path.basename(x) for x, _ in dup_result.failed] == ['file_1.txt']
+    assert len(dup_result.copied) + len(dup_result.failed) == 30
+
+
+def test_move_across_filesystems(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    def rename(src, dst):
+        raise OSError(errno.EXDEV, 'Invalid cross-device link')
+
+    src = tmp_path.joinpath('src')
+    src.joinpath('a').mkdir(parents=True)
+    src.joinpath('empty').mkdir()
+    src.joinpath('a', 'file.txt').write_text('content')
+    src.joinpath('a', 'flink').symlink_to('file.txt')
+    src.joinpath('dirlink').symlink_to('a', target_is_directory=True)
+    monkeypatch.setattr(os, 'rename', rename)
+
+    dst = tmp_path.joinpath('dst')
+    result = move(src, dst, parallel=True)
+    assert result is not None and not result.failed
+    assert not src.exists()
+    assert dst.joinpath('empty').is_dir()
+    assert dst.joinpath('a', 'file.txt').read_text() == 'content'
+    assert os.readlink(dst.joinpath('a', 'flink')) == 'file.txt'
+    assert os.readlink(dst.joinpath('dirlink')) == 'a'
+
+    src.joinpath('a').mkdir(parents=True)
+    result = move(src, dst, parallel=True)  # into the existing folder, like shutil.move
+    assert result is not None and not result.failed
+    assert dst.joinpath('src', 'a').is_dir()
+    src.mkdir()
+    with pytest.raises(shutil.Error):
+        move(src, dst, parallel=True)
+    src.rmdir()
+
+    src.mkdir()
+    os.mkfifo(src.joinpath('fifo'))
+    result = move(src, tmp_path.joinpath('dst_fifo'), parallel=True)
+    assert result is not None
+    assert [x for x, _ in result.failed] == [str(src.joinpath('fifo'))]
+    assert src.joinpath('fifo').exists()  # not removed, it was not copied
+
+
+def test_copy_file(tmp_path: Path):
+    src = tmp_path.joinpath('src.bin')
+    src.write_bytes(os.urandom(3 << 20))
+    dst = tmp_path.joinpath('dst.bin')
+    assert copy_file(src, dst) == 3 << 20
+    assert dst.read_bytes() == src.read_bytes()
+
+
+def test_copy_file_short_copy(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    def short_copy(*args):
+        return 0  # as filesystems stopping early do
+
+    def no_reflink(*args):
+        raise OSError(errno.EOPNOTSUPP, 'Operation not supported')
+
+    monkeypatch.setattr(fcntl, 'ioctl', no_reflink)
+    monkeypatch.setattr(os, 'copy_file_range', short_copy)
+    monkeypatch.setattr(os, 'sendfile', short_copy)
+    src = tmp_path.joinpath('src.bin')
+    src.write_bytes(os.urandom(3 << 20))
+    dst = tmp_path.joinpath('dst.bin')
+    assert copy_file(src, dst) == 3 << 20
+    assert dst.read_bytes() == src.read_bytes()
+
+
+def test_iter_sorted_paths(tmp_path: Path):
+    names = [f'folder_{i % 7}/file_{i}.txt' for i in range(1000)]
+    random.Random(0).shuffle(names)
+    expected = natsort.natsorted(names)
+    assert sort_paths(names) == [Path(x) for x in expected]
+    assert (
+        list(iter_sorted_paths(names, as_str=True, max_in_memory=64, tmp_dir=tmp_path)) == expected
+    )
+    assert os.listdir(tmp_path) == []
+
+    paths = iter_sorted_paths(iter(names), max_in_memory=64, tmp_dir=tmp_path)
+    assert next(paths) == Path(expected[0])
+    assert len(os.listdir(tmp_path)) == 1
+    paths.close()
+    assert os.listdir(tmp_path) == []
+
+
+def test_remove_folder_background(tmp_path: Path):
+    trash_root = tmp_path.joinpath(TRASH_NAME)
+    trash_root.joinpath('leftover', 'sub').mkdir(parents=True)
+    trash_root.joinpath('leftover', 'sub', 'file.txt').write_text('left')
+    folder = tmp_path.joinpath('folder')
+    for i in range(5):
+        folder.joinpath(f'sub_{i}', 'deeper').mkdir(parents=True)
+        for j in range(10):
+            folder.joinpath(f'sub_{i}', 'deeper', f'{j}.txt').write_text(str(j))
+    os.symlink(tmp_path, folder.joinpath('link'))
+
+    assert clear_folder(folder, background=True) == folder
+    assert os.listdir(folder) == []
+    wait_for_trash()
+    assert os.listdir(trash_root) == []
+    assert sorted(os.listdir(tmp_path)) == [TRASH_NAME, 'folder']